@@ -1,9 +1,5 @@
 import random as rnd
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import matplotlib.colors as colors
 import numpy as np
-import copy
 import sys
 from argparse import ArgumentParser, ArgumentError
 
@@ -17,19 +13,65 @@ GREEN = 1  # grass
 BLUE = 2  # pygmy
 RED = 3  # cottontail
 
+# grass regrows a tile of at most this many cells at a time (see Field._grow)
+TILE_CELLS = 1 << 22
+
+
+class Species:
+    """ Traits shared by every rabbit of a species """
+
+    __slots__ = ('name', 'offspring', 'hop_dist', 'color')
+
+    def __init__(self, name, offspring, hop_dist, color):
+        self.name = name
+        self.offspring = offspring
+        self.hop_dist = hop_dist
+        self.color = color
+
+
+# species table: index 0 is the pygmy, index 1 the cottontail
+PYGMY = 0
+COTTON_TAIL = 1
+SPECIES = (Species("pygmy", offspring=2, hop_dist=1, color=BLUE),
+           Species("cottontail", offspring=1, hop_dist=2, color=RED))
+
+# the same table as arrays, for the Field engine
+SPECIES_OFFSPRING = np.array([species.offspring for species in SPECIES])
+SPECIES_HOP = np.array([species.hop_dist for species in SPECIES])
+SPECIES_COLOR = np.array([species.color for species in SPECIES])
+
 
 class Rabbit:
     """ A furry creature roaming a field in search of grass to eat.
-    Mr. Rabbit must eat enough to reproduce, otherwise he will starve. """
-
-    def __init__(self, max_offspring=1, max_hop_distance=1, color=BLUE, field_size=300):
-        self.size = field_size
-        self.x = rnd.randrange(0, self.size)
-        self.y = rnd.randrange(0, self.size)
+    Mr. Rabbit must eat enough to reproduce, otherwise he will starve.
+    A rabbit only holds its own state (position and eaten); its traits
+    come from its species' entry in the species table, and the field it
+    moves in is passed to move """
+
+    __slots__ = ('x', 'y', 'eaten')
+    species = PYGMY
+
+    def __init__(self, *, size=None, x=None, y=None):
+        """ A rabbit at (x, y), or at a random position in a size x size field
+        (keyword only: the traits a rabbit used to take come from the species table) """
+
+        if size is None and (x is None or y is None):
+            raise TypeError("a rabbit needs a position or a field size")
+        self.x = rnd.randrange(0, size) if x is None else x
+        self.y = rnd.randrange(0, size) if y is None else y
         self.eaten = 0
-        self.offspring = max_offspring
-        self.hop_dist = max_hop_distance
-        self.color = color
+
+    @property
+    def offspring(self):
+        return SPECIES[self.species].offspring
+
+    @property
+    def hop_dist(self):
+        return SPECIES[self.species].hop_dist
+
+    @property
+    def color(self):
+        return SPECIES[self.species].color
 
     def reproduce(self):
         """ Make a new rabbit at the same location.
@@ -37,47 +79,66 @@ class Rabbit:
          rabbit's eaten level is reset to zero. """
 
         self.eaten = 0
-        return copy.deepcopy(self)
+        return type(self)(x=self.x, y=self.y)
 
     def eat(self, amount):
         """ Feed the rabbit some grass """
 
         self.eaten += amount
 
-    def move(self):
-        """ Move up, down, left, right randomly """
+    def move(self, size):
+        """ Move up, down, left, right randomly, at most hop_dist cells, in a size x size field """
 
-        # create a list of possible moves in integer set: {-max_hop_distance, ..., max_hop_distance}
-        mv_lst = list(range(-self.hop_dist, self.hop_dist + 1))
-
-        # move rabbit
+        hop = self.hop_dist
         if WRAP:
-            self.x = (self.x + rnd.choice(mv_lst)) % self.size
-            self.y = (self.y + rnd.choice(mv_lst)) % self.size
+            self.x = (self.x + rnd.randint(-hop, hop)) % size
+            self.y = (self.y + rnd.randint(-hop, hop)) % size
         else:
-            self.x = min(self.size - 1, max(0, (self.x + rnd.choice(mv_lst))))
-            self.y = min(self.size - 1, max(0, (self.y + rnd.choice(mv_lst))))
+            self.x = min(size - 1, max(0, (self.x + rnd.randint(-hop, hop))))
+            self.y = min(size - 1, max(0, (self.y + rnd.randint(-hop, hop))))
 
 
 class Pygmy(Rabbit):
 
-    def __init__(self, size=300):
-        super().__init__(max_offspring=2, field_size=size)
+    __slots__ = ()
+    species = PYGMY
+
+    def __init__(self, size=300, x=None, y=None):
+        super().__init__(size=size, x=x, y=y)
 
 
 class CottonTail(Rabbit):
 
-    def __init__(self, size=300):
-        super().__init__(max_hop_distance=2, color=RED, field_size=size)
+    __slots__ = ()
+    species = COTTON_TAIL
+
+    def __init__(self, size=300, x=None, y=None):
+        super().__init__(size=size, x=x, y=y)
 
 
 class Field:
     """ A field is a patch of grass with 0 or more rabbits hopping around
-    in search of grass """
-
-    def __init__(self, field_size=300, grass_rate=0.1, num_pygmy=1, num_cotton_tail=1):
+    in search of grass.
+    Rabbits are stored as a structure of arrays (x, y, eaten, species), so every
+    step of a generation is a handful of vectorized operations over all rabbits.
+    The arrays are a pool: the live rabbits are packed at the front, deaths are
+    compacted in place and births are appended in bulk to the spare capacity,
+    which only grows (geometrically) when a generation outgrows it.
+    The grass is a uint8 grid regrown in place a tile of rows at a time, so
+    fields far larger than 10k x 10k need no full-size temporaries per generation """
+
+    def __init__(self, field_size=300, grass_rate=0.1, num_pygmy=1, num_cotton_tail=1,
+                 hop=tuple(SPECIES_HOP), offspring=tuple(SPECIES_OFFSPRING), seed=None, tile=None):
         """ Create a patch of grass with dimensions size x size
-        and initially no rabbits """
+        and initially no rabbits
+        hop and offspring are the (pygmy, cottontail) max hop distance and max offspring
+        seed seeds the field's own random stream (an int or a np.random.SeedSequence)
+        tile is the number of rows of grass regrown at a time (default: TILE_CELLS cells' worth) """
+
+        # every draw goes through this generator, so runs with the same seed are identical
+        self.rng = np.random.default_rng(seed)
+        self.hop = np.asarray(hop)
+        self.offspring = np.asarray(offspring)
 
         # set field size
         self.size = field_size
@@ -86,62 +147,173 @@ class Field:
         self.grass_rate = grass_rate
 
         # initialize field
-        self.field = np.ones(shape=(self.size, self.size), dtype=int)
-
-        # initialize rabbits
-        self.rabbits = [Pygmy(self.size) for _ in range(num_pygmy)]
-        self.rabbits.extend([CottonTail(self.size)
-                            for _ in range(num_cotton_tail)])
+        self.field = np.ones(shape=(self.size, self.size), dtype=np.uint8)
+        self.tile = max(1, TILE_CELLS // self.size) if tile is None else tile
+
+        # field image, built only when rendering and then recoloured only at the cells
+        # that changed since the last frame (see _update_plot); None: redraw it all
+        self.plot = None
+        self._changed = None
+
+        # initialize rabbits at random positions
+        n = num_pygmy + num_cotton_tail
+        # 10 bytes per rabbit: int32 coordinates, int8 eaten and species
+        self.n = 0
+        self._x = np.empty(0, dtype=np.int32)
+        self._y = np.empty(0, dtype=np.int32)
+        self._eaten = np.empty(0, dtype=np.int8)
+        self._species = np.empty(0, dtype=np.int8)
+        self._add(self.rng.integers(0, self.size, size=n), self.rng.integers(0, self.size, size=n),
+                  np.repeat([PYGMY, COTTON_TAIL], [num_pygmy, num_cotton_tail]))
+
+        # running state updated as rabbits move, die and are born, and as grass is eaten
+        # and grows: rabbits per species and cell, rabbits per species, cells with grass
+        # A cell only ever receives rabbits from the cells within hopping range: in the first
+        # generation their initial rabbits, later one survivor and its litter each
+        cells = self._cells()
+        crowd = int(np.unique(cells, return_counts=True)[1].max()) if len(cells) else 0
+        reach = (2 * self.hop + 1) ** 2
+        dtype = np.min_scalar_type(int(max(np.max(reach * (1 + self.offspring)), np.max(reach) * crowd)))
+        self.occupancy = np.zeros((2, self.size, self.size), dtype=dtype)
+        self._occupy(cells, 1)
+        self.counts = np.bincount(self.species, minlength=2)
+        self.grass = self.size * self.size
 
         # keep track of number of rabbits per species and amount of grass
         self.npygmy = [num_pygmy]
         self.ncotton = [num_cotton_tail]
         self.ngrass = [self.size * self.size]
 
-        # create colormap
-        cmap = colors.ListedColormap(["white", "green", "blue", "red"])
-
-        # set field to plot
-        self._update_plot()
-
-        # set image to animate
-        self.fig = plt.figure(figsize=(5, 5))
-        self.im = plt.imshow(self.plot, cmap=cmap,
-                             aspect='auto', vmin=0, vmax=3)
+    # views of the live rabbits in the pool
+    x = property(lambda self: self._x[:self.n])
+    y = property(lambda self: self._y[:self.n])
+    eaten = property(lambda self: self._eaten[:self.n])
+    species = property(lambda self: self._species[:self.n])
+
+    def _add(self, x, y, species):
+        """ Append rabbits (with nothing eaten) to the pool, growing it if it is full """
+
+        n, k = self.n, len(x)
+        if n + k > len(self._x):
+            capacity = max(16, 2 * len(self._x), n + k)
+            for name in ('_x', '_y', '_eaten', '_species'):
+                grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+                grown[:n] = getattr(self, name)[:n]
+                setattr(self, name, grown)
+        self._x[n:n + k] = x
+        self._y[n:n + k] = y
+        self._eaten[n:n + k] = 0
+        self._species[n:n + k] = species
+        self.n = n + k
+
+    def _cells(self):
+        """ Index of every rabbit's (species, x, y) cell in the flattened occupancy grid """
+
+        return (self.species.astype(np.intp) * self.size + self.x) * self.size + self.y
+
+    def _occupy(self, cells, amount):
+        """ Add amount (a number, or one per cell) rabbits to cells of the occupancy grid
+        Few changes are applied in place; many are binned, which is far cheaper per change """
+
+        # the grid is unsigned: negative amounts wrap around, which unsigned addition undoes
+        occupancy = self.occupancy.reshape(-1)
+        if self._changed is not None:
+            self._touch(cells % (self.size * self.size))
+        if len(cells) * 8 < len(occupancy):
+            np.add.at(occupancy, cells, np.asarray(amount).astype(occupancy.dtype))
+        else:
+            weights = np.broadcast_to(amount, cells.shape)
+            binned = np.bincount(cells, weights=weights, minlength=len(occupancy))
+            occupancy += binned.astype(np.int64).astype(occupancy.dtype)
+
+    def _touch(self, cells):
+        """ Note cells (flattened x, y indices) whose color may have changed since the last frame
+        Recolouring cell by cell only pays off for few changes: once they exceed an eighth
+        of the field, the next frame is redrawn whole instead (and no more are noted) """
+
+        if self._changed is None:
+            return
+        self._changed.append(cells)
+        self._pending += len(cells)
+        if self._pending * 8 > self.size * self.size:
+            self._changed = None
 
     def _update_plot(self):
-        """ Update field to plot """
+        """ Update field to plot: grass, with pygmies over it and cottontails over both
+        The first frame is drawn whole; later frames only recolour the cells where rabbits
+        moved, died or were born and grass was eaten or grew since the previous frame """
+
+        if self.plot is None or self._changed is None:
+            if self.plot is None:
+                self.plot = np.empty((self.size, self.size), dtype=np.int8)
+            np.copyto(self.plot, self.field)
+            self.plot[self.occupancy[PYGMY] > 0] = BLUE
+            self.plot[self.occupancy[COTTON_TAIL] > 0] = RED
+        elif self._changed:
+            cells = np.concatenate(self._changed)
+            colors = self.field.reshape(-1)[cells].astype(np.int8)
+            colors[self.occupancy[PYGMY].reshape(-1)[cells] > 0] = BLUE
+            colors[self.occupancy[COTTON_TAIL].reshape(-1)[cells] > 0] = RED
+            self.plot.reshape(-1)[cells] = colors
+        self._changed = []
+        self._pending = 0
 
-        # pygmy and cottontail arrays in dict
-        rabbit_dict = self._get_rabbits()
+    def _move(self):
+        """ Rabbits move up, down, left, right randomly, up to their species' hop distance """
 
-        # plot of field to use for field animation
-        self.plot = np.maximum.reduce(
-            [self.field, rabbit_dict['pygmy'], rabbit_dict['cotton']])
+        before = self._cells()
+        hop = self.hop[self.species]
+        dx = self.rng.integers(-hop, hop + 1)
+        dy = self.rng.integers(-hop, hop + 1)
+        if WRAP:
+            self.x[:] = (self.x + dx) % self.size
+            self.y[:] = (self.y + dy) % self.size
+        else:
+            self.x[:] = np.clip(self.x + dx, 0, self.size - 1)
+            self.y[:] = np.clip(self.y + dy, 0, self.size - 1)
 
-    def _move(self):
-        """ Rabbits move """
-        for r in self.rabbits:
-            r.move()
+        # only rabbits that changed cell touch the occupancy grid
+        after = self._cells()
+        moved = before != after
+        self._occupy(before[moved], -1)
+        self._occupy(after[moved], 1)
 
     def _eat(self):
-        """ Rabbits eat (if they find grass where they are) """
-
-        for rabbit in self.rabbits:
-            rabbit.eat(self.field[rabbit.x, rabbit.y])
-            self.field[rabbit.x, rabbit.y] = 0
+        """ Rabbits eat (if they find grass where they are)
+        When rabbits share a cell, the first of them eats the grass """
+
+        cells = self.x.astype(np.intp) * self.size + self.y
+        cells, first = np.unique(cells, return_index=True)
+        grass = self.field.reshape(-1)
+        food = grass[cells]
+        self.eaten[first] += food
+        self.grass -= int(np.count_nonzero(food))
+        grass[cells] = 0
+        if self._changed is not None:
+            self._touch(cells)
 
     def _survive(self):
         """ Rabbits who eat some grass live to eat another day """
-        self.rabbits = [r for r in self.rabbits if r.eaten > 0]
+
+        alive = self.eaten > 0
+        dead = ~alive
+        self._occupy(self._cells()[dead], -1)
+        self.counts -= np.bincount(self.species[dead], minlength=2)
+        k = int(np.count_nonzero(alive))
+        for column in (self._x, self._y, self._eaten, self._species):
+            column[:k] = column[:self.n][alive]
+        self.n = k
 
     def _reproduce(self):
-        """ Rabbits reproduce like rabbits. """
-        born = []
-        for rabbit in self.rabbits:
-            for _ in range(rnd.randint(1, rabbit.offspring)):
-                born.append(rabbit.reproduce())
-        self.rabbits += born
+        """ Rabbits reproduce like rabbits.
+        Each rabbit has 1 to its species' max offspring newborns at its own location.
+        Reproduction is hard work! Each reproducing rabbit's eaten level is reset to zero. """
+
+        litters = self.rng.integers(1, self.offspring[self.species] + 1)
+        self._occupy(self._cells(), litters)
+        self.counts += np.bincount(self.species, weights=litters, minlength=2).astype(self.counts.dtype)
+        self.eaten[:] = 0
+        self._add(np.repeat(self.x, litters), np.repeat(self.y, litters), np.repeat(self.species, litters))
 
         # Capture field state for historical tracking
         rabbit_count = self._num_rabbits()
@@ -150,36 +322,39 @@ class Field:
         self.ngrass.append(self._amount_of_grass())
 
     def _grow(self):
-        """ Grass grows back with some probability """
-        growloc = (np.random.rand(self.size, self.size) < self.grass_rate) * 1
-        self.field = np.maximum(self.field, growloc)
+        """ Grass grows back with some probability on every empty cell.
+        Only the empty cells of a tile are sampled: a binomial draw gives how many of
+        them grow back and that many are picked at random and set in place """
+
+        if self.grass == self.size * self.size:
+            return
+        for start in range(0, self.size, self.tile):
+            cells = self.field[start:start + self.tile].reshape(-1)
+            empty = np.flatnonzero(cells == 0)
+            k = int(self.rng.binomial(len(empty), self.grass_rate))
+            if k:
+                grown = self.rng.choice(empty, k, replace=False)
+                cells[grown] = 1
+                self.grass += k
+                if self._changed is not None:
+                    self._touch(start * self.size + grown)
 
     def _get_rabbits(self):
-        """ Get arrays of pygmy and cottontail rabbits to use in plotting """
+        """ Get grids of pygmy and cottontail rabbits to use in plotting
+        They are views of the occupancy grid (rabbits of the species per cell, nonzero
+        wherever the species is), so they follow the field without being copied """
 
-        # initialize 2 arrays to keep track of both rabbit populations
-        pygmy = np.zeros(shape=(self.size, self.size), dtype=int)
-        cotton = np.zeros(shape=(self.size, self.size), dtype=int)
-
-        # add rabbits' colors (2 or 3) to each numpy array at their position
-        for r in self.rabbits:
-            if r.color == 2:
-                pygmy[r.x, r.y] = r.color
-            elif r.color == 3:
-                cotton[r.x, r.y] = r.color
-        return {'pygmy': pygmy, 'cotton': cotton}
+        return {'pygmy': self.occupancy[PYGMY], 'cotton': self.occupancy[COTTON_TAIL]}
 
     def _num_rabbits(self):
         """ How many rabbits are there in the field ? """
 
-        rabbit_list = [rabbit.color for rabbit in self.rabbits]
-        return rabbit_list.count(2), rabbit_list.count(3)
+        return int(self.counts[PYGMY]), int(self.counts[COTTON_TAIL])
 
     def _amount_of_grass(self):
         """ calculate how much grass is currently on field """
 
-        num_grass = np.sum(self.field[self.field == 1])
-        return num_grass
+        return self.grass
 
     def _generation(self):
         """ Run one generation of rabbits """
@@ -190,6 +365,16 @@ class Field:
         self._reproduce()
         self._grow()
 
+    def simulate(self, generations=5000, observer=None, every=1):
+        """ Run the simulation headless (no matplotlib needed).
+        observer(field, generation) is called every `every` generations, e.g. a FieldRenderer """
+
+        for generation in range(1, generations + 1):
+            self._generation()
+            if observer is not None and generation % every == 0:
+                observer(self, generation)
+        return self
+
     def _animate(self, i, speed=1):
         """ Animate one frame of the simulation"""
 
@@ -201,6 +386,7 @@ class Field:
         self._update_plot()
 
         # Update the frame
+        import matplotlib.pyplot as plt
         self.im.set_array(self.plot)
         plt.title("generation = " + str((i + 1) * speed))
         return self.im,
@@ -208,6 +394,15 @@ class Field:
     def run(self, generations=5000, speed=1):
         """ Run the simulation. Speed denotes how may generations run between successive frames """
 
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
+        # set image to animate
+        self._update_plot()
+        self.fig = plt.figure(figsize=(5, 5))
+        self.im = plt.imshow(self.plot, cmap=_colormap(),
+                             aspect='auto', vmin=0, vmax=3)
+
         anim = animation.FuncAnimation(self.fig, self._animate, fargs=(
             speed, ), frames=generations // speed, interval=1, repeat=False)
         plt.show()
@@ -223,6 +418,9 @@ class Field:
     def history(self, speed=1, marker='.'):
         """ Animated line plot of Pygmy and CottonTail populations over generations """
 
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
         # initialize plot
         fig, ax = plt.subplots()
 
@@ -259,6 +457,9 @@ class Field:
     def history2(self, speed=1, marker='.'):
         """ Animated line plot of Pygmy vs. CottonTail populations """
 
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
         # initialize plot
         fig, ax = plt.subplots()
 
@@ -285,6 +486,8 @@ class Field:
     def history3(self, marker='o'):
         """ 3D plot of Pygmy vs. CottonTail vs. Grass populations """
 
+        import matplotlib.pyplot as plt
+
         # initialize 3D plot
         fig = plt.figure(figsize=(6, 6))
         ax = fig.add_subplot(projection='3d')
@@ -307,6 +510,43 @@ class Field:
         plt.show()
 
 
+def _colormap():
+    """ Colors of empty space, grass, pygmies and cottontails """
+
+    import matplotlib.colors as colors
+    return colors.ListedColormap(["white", "green", "blue", "red"])
+
+
+class FieldRenderer:
+    """ Observer for Field.simulate that draws the field every time it is called.
+    matplotlib is only imported when the first frame is drawn. With a path, frames are
+    written to image files (path % generation) instead of shown, which needs no display """
+
+    def __init__(self, path=None, pause=0.001):
+        self.path = path
+        self.pause = pause
+        self.fig = None
+        self.im = None
+
+    def __call__(self, field, generation):
+        field._update_plot()
+        if self.fig is None:
+            from matplotlib.figure import Figure
+            import matplotlib.pyplot as plt
+
+            # a bare Figure when writing files, so no GUI backend is touched
+            self.fig = Figure(figsize=(5, 5)) if self.path else plt.figure(figsize=(5, 5))
+            ax = self.fig.add_subplot()
+            self.im = ax.imshow(field.plot, cmap=_colormap(), aspect='auto', vmin=0, vmax=3)
+        self.im.set_array(field.plot)
+        self.fig.axes[0].set_title("generation = " + str(generation))
+        if self.path:
+            self.fig.savefig(self.path % generation)
+        else:
+            import matplotlib.pyplot as plt
+            plt.pause(self.pause)
+
+
 def main():
     # parse user defined parameters from command line
     # $ python rabbit_life_sim.py <field size> <initial pygmy> <initial cottontail> <sim speed> --gens <num generations> --grass <grass growth rate>
@@ -318,6 +558,10 @@ def main():
     parser.add_argument('speed', type=int, help='simulation speed')
     parser.add_argument('--gens', type=int, help='number of generations')
     parser.add_argument('--grass', type=float, help='grass growth rate')
+    parser.add_argument('--headless', action='store_true',
+                        help='run without a display (no animation, history plot written to pop_hist.png)')
+    parser.add_argument('--frames', help='headless only: write a frame every <speed> generations, '
+                                         'e.g. frame_%%06d.png')
 
     args = parser.parse_args()
 
@@ -329,6 +573,15 @@ def main():
         field = Field(field_size=args.size, grass_rate=args.grass,
                       num_pygmy=args.pygmy, num_cotton_tail=args.cotton)
 
+    if args.headless:
+        import matplotlib
+        matplotlib.use('Agg')
+        observer = FieldRenderer(args.frames) if args.frames else None
+        field.simulate(5000 if args.gens is None else args.gens, observer=observer, every=args.speed)
+        print("pygmy:", field.npygmy[-1], "cottontail:", field.ncotton[-1], "grass:", field.ngrass[-1])
+        field.history3()
+        return
+
     # Run the ecosystem
     if args.gens is None:
         field.run(speed=args.speed)
@@ -0,0 +1,149 @@
+"""
+@file: sweep.py: Parallel parameter sweeps of the rabbit ecosystem
+Runs many headless Field simulations (a grid or a random sample of
+configurations, each replicated) on a process pool. Every run gets its own
+random stream spawned from one master seed, so a sweep is reproducible no
+matter how the runs are scheduled. The population histories of all runs are
+written to one columnar file, one row per (run, generation):
+    .csv      plain CSV
+    otherwise a NumPy .npz archive with one array per column
+
+$ python sweep.py --size 100 200 --grass 0.05 0.1 --replicates 100 --gens 500 --out sweep.npz
+"""
+
+import csv
+import itertools
+import multiprocessing as mp
+from argparse import ArgumentParser
+
+import numpy as np
+
+from rabbit_life_sim import Field
+
+# swept parameters and their defaults
+PARAMS = {"field_size": 100, "grass_rate": 0.1, "num_pygmy": 10, "num_cotton_tail": 10,
+          "pygmy_hop": 1, "cotton_hop": 2, "pygmy_offspring": 2, "cotton_offspring": 1}
+HISTORY = ("npygmy", "ncotton", "ngrass")
+
+
+def grid(**values):
+    """ Every combination of the given parameter values: grid(grass_rate=[0.05, 0.1], ...) """
+
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+
+def random_sample(n, seed=0, **ranges):
+    """ n random configurations. A (low, high) tuple is sampled uniformly (integers if both
+    bounds are integers, high inclusive), a list is sampled as a set of choices """
+
+    rng = np.random.default_rng(seed)
+    configs = [{} for _ in range(n)]
+    for name, spec in ranges.items():
+        if isinstance(spec, tuple):
+            low, high = spec
+            if isinstance(low, int) and isinstance(high, int):
+                draws = rng.integers(low, high + 1, size=n).tolist()
+            else:
+                draws = rng.uniform(low, high, size=n).tolist()
+        else:
+            draws = [spec[i] for i in rng.integers(0, len(spec), size=n)]
+        for config, value in zip(configs, draws):
+            config[name] = value
+    return configs
+
+
+def run_one(task):
+    """ Simulate one (run id, configuration, seed sequence, generations) task in a worker """
+
+    run, config, seed, generations = task
+    params = dict(PARAMS, **config)
+    field = Field(field_size=params["field_size"], grass_rate=params["grass_rate"],
+                  num_pygmy=params["num_pygmy"], num_cotton_tail=params["num_cotton_tail"],
+                  hop=(params["pygmy_hop"], params["cotton_hop"]),
+                  offspring=(params["pygmy_offspring"], params["cotton_offspring"]), seed=seed)
+    field.simulate(generations)
+    return run, params, {name: np.asarray(getattr(field, name), dtype=np.int64) for name in HISTORY}
+
+
+def sweep(configs, replicates=1, generations=500, workers=None, seed=0, out=None):
+    """ Run every configuration replicates times and return the results as columns
+    (run, replicate, the parameters, generation, npygmy, ncotton, ngrass), optionally
+    writing them to out """
+
+    runs = [(config, r) for config in configs for r in range(replicates)]
+    seeds = np.random.SeedSequence(seed).spawn(len(runs))
+    tasks = [(run, config, seeds[run], generations) for run, (config, _) in enumerate(runs)]
+
+    results = [None] * len(runs)
+    with mp.get_context().Pool(workers) as pool:
+        for run, params, history in pool.imap_unordered(run_one, tasks, chunksize=max(1, len(tasks) // 64)):
+            results[run] = (params, history)
+
+    columns = _columns(runs, results)
+    if out is not None:
+        write_results(out, columns)
+    return columns
+
+
+def _columns(runs, results):
+    """ Long-format columns: every run contributes one row per generation """
+
+    lengths = [len(history["npygmy"]) for _, history in results]
+    columns = {"run": np.repeat(np.arange(len(runs)), lengths),
+               "replicate": np.repeat([r for _, r in runs], lengths)}
+    for name in PARAMS:
+        columns[name] = np.repeat([params[name] for params, _ in results], lengths)
+    columns["generation"] = np.concatenate([np.arange(n) for n in lengths]) if lengths else np.empty(0, int)
+    for name in HISTORY:
+        columns[name] = np.concatenate([history[name] for _, history in results]) if results else np.empty(0, int)
+    return columns
+
+
+def write_results(path, columns):
+    """ Write result columns to a .csv file, or to an .npz archive otherwise """
+
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*(column.tolist() for column in columns.values())))
+    else:
+        np.savez_compressed(path, **columns)
+
+
+def main():
+    parser = ArgumentParser(description="Parallel parameter sweep of the rabbit ecosystem")
+    parser.add_argument('--size', type=int, nargs='+', default=[PARAMS["field_size"]], help='field sizes')
+    parser.add_argument('--grass', type=float, nargs='+', default=[PARAMS["grass_rate"]], help='grass growth rates')
+    parser.add_argument('--pygmy', type=int, nargs='+', default=[PARAMS["num_pygmy"]], help='initial pygmies')
+    parser.add_argument('--cotton', type=int, nargs='+', default=[PARAMS["num_cotton_tail"]],
+                        help='initial cottontails')
+    parser.add_argument('--pygmy-hop', type=int, nargs='+', default=[PARAMS["pygmy_hop"]])
+    parser.add_argument('--cotton-hop', type=int, nargs='+', default=[PARAMS["cotton_hop"]])
+    parser.add_argument('--pygmy-offspring', type=int, nargs='+', default=[PARAMS["pygmy_offspring"]])
+    parser.add_argument('--cotton-offspring', type=int, nargs='+', default=[PARAMS["cotton_offspring"]])
+    parser.add_argument('--random', type=int, default=None,
+                        help='sample this many configurations from the given values instead of the full grid')
+    parser.add_argument('--replicates', type=int, default=10, help='runs per configuration')
+    parser.add_argument('--gens', type=int, default=500, help='generations per run')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0, help='master seed')
+    parser.add_argument('--out', default='sweep.npz', help='results file (.csv or .npz)')
+    args = parser.parse_args()
+
+    values = {"field_size": args.size, "grass_rate": args.grass, "num_pygmy": args.pygmy,
+              "num_cotton_tail": args.cotton, "pygmy_hop": args.pygmy_hop, "cotton_hop": args.cotton_hop,
+              "pygmy_offspring": args.pygmy_offspring, "cotton_offspring": args.cotton_offspring}
+    configs = grid(**values) if args.random is None else random_sample(args.random, args.seed, **values)
+
+    columns = sweep(configs, args.replicates, args.gens, args.workers, args.seed, args.out)
+    last = columns["generation"] == args.gens
+    print("runs:", len(configs) * args.replicates,
+          "pygmy extinct:", int(np.sum(columns["npygmy"][last] == 0)),
+          "cottontail extinct:", int(np.sum(columns["ncotton"][last] == 0)))
+    print("results written to", args.out)
+
+
+if __name__ == '__main__':
+    main()
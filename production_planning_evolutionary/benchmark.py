@@ -0,0 +1,156 @@
+"""
+@file: benchmark.py: Benchmark harness for the Evo framework on production planning
+Reports evolve throughput, Pareto filtering time, solution copy cost and
+per-fitness-function cost while sweeping population size, order count and
+objective count. Results are written as JSON for regression comparison.
+
+$ python benchmark.py --orders 100 1000 10000 --pop 100 1000 10000 --out bench.json
+"""
+
+import copy
+import json
+import platform
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from evo import Evo
+import orderbook
+import product_planning as pp
+from schedule import Schedule, copy_schedule
+
+OBJECTIVES = ["setups", "low_priority", "delays"]
+AGENTS = ["setups_agent", "low_priority_agent", "delays_agent"]
+
+
+def synthetic_orders(n, seed=0):
+    """ Orders OrderedDict shaped like orders.json with n orders (see orderbook.generate) """
+
+    return orderbook.generate_table(n, seed).to_orders(range(n))
+
+
+def _timeit(f, repeat):
+    """ Mean seconds per call of f over repeat calls """
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat
+
+
+def _make_evo(orders, objectives, batch):
+    """ Evo for the orders with the first objectives registered """
+
+    E = Evo(copier=copy_schedule, stacker=Schedule.stack)
+    for name in OBJECTIVES[:objectives]:
+        if batch:
+            E.add_fitness_criteria(name, getattr(pp, name + "_batch"), batch=True)
+        else:
+            E.add_fitness_criteria(name, getattr(pp, name))
+    for name in AGENTS:
+        E.add_agent(name, getattr(pp, name))
+    E.add_solution(Schedule.from_orders(orders))
+    return E
+
+
+def bench_evolve(orders, objectives, iterations, batch):
+    """ Agent invocations per second of evolve """
+
+    E = _make_evo(orders, objectives, batch > 1)
+    start = time.perf_counter()
+    E.evolve(iterations, status=None, sync=None, batch=batch)
+    elapsed = time.perf_counter() - start
+    return {"iterations_per_sec": iterations / elapsed, "front_size": E.size()}
+
+
+def bench_remove_dominated(pop_size, objectives, repeat, seed=0):
+    """ Seconds per remove_dominated on a plain dict population and per archive insert """
+
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, pop_size, size=(pop_size, objectives)).tolist()
+    evals = list({tuple(zip(OBJECTIVES, row)) for row in scores})
+
+    E = Evo()
+
+    def remove_dominated():
+        E.pop = {eval: None for eval in evals}
+        E.remove_dominated()
+
+    def fill_archive():
+        E.pop = Evo().pop
+        for eval in evals:
+            E.pop.insert(eval, None)
+
+    return {"remove_dominated_sec": _timeit(remove_dominated, repeat),
+            "archive_insert_sec": _timeit(fill_archive, repeat) / len(evals),
+            "front_size": len(E.pop)}
+
+
+def bench_copy(orders, repeat):
+    """ Seconds to copy one solution: deepcopy of the orders dict vs a Schedule copy """
+
+    schedule = Schedule.from_orders(orders)
+    return {"deepcopy_orders_sec": _timeit(lambda: copy.deepcopy(orders), max(1, repeat // 10)),
+            "copy_schedule_sec": _timeit(lambda: copy_schedule(schedule), repeat)}
+
+
+def bench_fitness(orders, repeat, batch=100):
+    """ Seconds per solution for each fitness function (dict, schedule and batch forms) """
+
+    rng = np.random.default_rng(0)
+    base = Schedule.from_orders(orders)
+    sols = [Schedule(base.table, rng.permutation(len(orders)).astype(np.int32)) for _ in range(batch)]
+    results = {}
+    for name in OBJECTIVES:
+        dict_f = getattr(pp, name + "_orders")
+        f = getattr(pp, name)
+        batch_f = getattr(pp, name + "_batch")
+
+        # fresh copies so the score caches do not short-circuit the kernels
+        results[name] = {
+            "orders_sec": _timeit(lambda: dict_f(orders), max(1, repeat // 10)),
+            "schedule_sec": _timeit(lambda: f(Schedule(base.table, base.perm)), repeat),
+            "batch_sec": _timeit(lambda: batch_f(Schedule.stack([Schedule(s.table, s.perm) for s in sols])),
+                                 max(1, repeat // 10)) / batch,
+        }
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the Evo framework on production planning")
+    parser.add_argument('--orders', type=int, nargs='+', default=[100, 1000, 10000], help='order counts')
+    parser.add_argument('--pop', type=int, nargs='+', default=[100, 1000, 10000], help='population sizes')
+    parser.add_argument('--objectives', type=int, nargs='+', default=[1, 2, 3], help='objective counts')
+    parser.add_argument('--iterations', type=int, default=2000, help='evolve iterations per run')
+    parser.add_argument('--batch', type=int, default=50, help='batch size for batched evolve')
+    parser.add_argument('--repeat', type=int, default=100, help='repetitions of micro benchmarks')
+    parser.add_argument('--out', default='bench.json', help='JSON results file')
+    args = parser.parse_args()
+
+    results = {"platform": platform.platform(), "python": platform.python_version(),
+               "evolve": [], "remove_dominated": [], "copy": [], "fitness": []}
+
+    for n in args.orders:
+        orders = synthetic_orders(n)
+        print("orders:", n)
+        results["copy"].append({"orders": n, **bench_copy(orders, args.repeat)})
+        results["fitness"].append({"orders": n, **bench_fitness(orders, args.repeat)})
+        for objectives in args.objectives:
+            for batch in (1, args.batch):
+                results["evolve"].append({"orders": n, "objectives": objectives, "batch": batch,
+                                          **bench_evolve(orders, objectives, args.iterations, batch)})
+
+    for size in args.pop:
+        print("population:", size)
+        for objectives in args.objectives:
+            results["remove_dominated"].append({"population": size, "objectives": objectives,
+                                                **bench_remove_dominated(size, objectives, max(1, args.repeat // 20))})
+
+    with open(args.out, "w") as file:
+        json.dump(results, file, indent=2)
+    print("results written to", args.out)
+
+
+if __name__ == '__main__':
+    main()
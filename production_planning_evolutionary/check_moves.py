@@ -0,0 +1,177 @@
+"""
+@file: check_moves.py: Randomized consistency checks for the moves and objective kernels
+    moves   random swap / insert / block_move / reverse sequences: after every move the
+            scores kept by delta evaluation (moves.py) must equal a full re-score
+    agents  the permutation agents, run step for step next to the original dict-based
+            agents on the orders OrderedDict, must produce the same schedules, and the
+            array objectives must agree with the *_orders objectives on every step
+Exits with an error at the first mismatch, so run it after changing moves.py, the
+objective kernels or the agents.
+
+$ python check_moves.py --moves 20000 --steps 300 --seed 0
+"""
+
+import os
+import random as rand
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+import numpy as np
+
+import moves
+import orderbook
+import product_planning as pp
+from schedule import Schedule
+
+OBJECTIVES = ["setups", "low_priority", "delays"]
+ORDERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "orders.json")
+
+
+def tables(seed=0):
+    """ orders.json and generated books covering mostly HIGH, mostly LOW and single-product mixes """
+
+    yield "orders.json", orderbook.load_table(ORDERS)
+    yield "generated", orderbook.generate_table(200, seed)
+    yield "mostly HIGH", orderbook.generate_table(150, seed + 1, high=0.9)
+    yield "mostly LOW", orderbook.generate_table(150, seed + 2, high=0.05)
+    yield "one product", orderbook.generate_table(60, seed + 3, mix=[1, 0, 0, 0, 0])
+
+
+def full_scores(sol):
+    """ Scores of a schedule from scratch, with the kernels """
+
+    score, last_high = pp._low_priority(sol.table, sol.perm)
+    return {"setups": int(pp._setups(sol.table, sol.perm)), "low_priority": int(score),
+            "delays": int(pp._delays(sol.table, sol.perm)), "last_high": int(last_high)}
+
+
+def random_move(sol, rng):
+    """ Apply a random move to sol; returns a description of it """
+
+    n = len(sol)
+    kind = rng.choice(["swap", "insert", "block_move", "reverse"])
+    if kind == "block_move":
+        i, j = sorted(rng.sample(range(n + 1), 2))
+        k = rng.choice([k for k in range(n + 1) if k <= i or k >= j])
+        moves.block_move(sol, i, j, k)
+        return kind, i, j, k
+    if kind == "reverse":
+        i, j = sorted(rng.sample(range(n + 1), 2))
+        moves.reverse(sol, i, j)
+        return kind, i, j
+    i, j = rng.randrange(n), rng.randrange(n)
+    getattr(moves, kind)(sol, i, j)
+    return kind, i, j
+
+
+def check_moves(table, count, rng):
+    """ count random moves on one schedule, comparing the delta-evaluated scores after each """
+
+    sol = Schedule(table, np.array(rng.sample(range(len(table)), len(table)), dtype=np.int32))
+    for name in OBJECTIVES:
+        getattr(pp, name)(sol)
+
+    for step in range(count):
+        move = random_move(sol, rng)
+        expected = full_scores(sol)
+        if sol.scores != expected:
+            raise AssertionError("move %d %s: delta scores %s != full scores %s"
+                                 % (step, move, sol.scores, expected))
+        if sorted(sol.perm.tolist()) != list(range(len(table))):
+            raise AssertionError("move %d %s: the schedule is no longer a permutation" % (step, move))
+
+
+def dict_setups_agent(solutions):
+    """ Original agent on the orders OrderedDict: minimize number of setups """
+
+    orders = solutions[0]
+    order_ids = list(orders.keys())
+    index = 0
+    for i in range(len(order_ids)):
+        key = order_ids[i]
+        value = orders[str(key)]["product"]
+        if i < len(order_ids) - 1:
+            next = order_ids[i + 1]
+            if (int(next) != len(order_ids) + 1) and (value != orders[next]["product"]):
+                index = i
+                break
+
+    next = order_ids[index + 1]
+    for i in range(index, len(order_ids)):
+        orders.move_to_end(next)
+        order_ids.append(order_ids.pop(order_ids.index(next)))
+        next = order_ids[index + 1]
+        if (int(next) != len(order_ids) + 1) and (value == orders[next]["product"]):
+            break
+    return orders
+
+
+def dict_low_priority_agent(solutions):
+    """ Original agent on the orders OrderedDict: minimize low priority score """
+
+    orders = solutions[0]
+    for key in list(orders.keys()):
+        if orders[key]["priority"] == "LOW":
+            orders.move_to_end(key)
+            break
+    return orders
+
+
+def dict_delays_agent(solutions):
+    """ Original agent on the orders OrderedDict: minimize delay """
+
+    orders = solutions[0]
+    order_ids = list(orders.keys())
+    for i in range(len(order_ids) - 1):
+        if int(order_ids[i]) > int(order_ids[i + 1]):
+            orders_list = list(orders.items())
+            orders_list[i], orders_list[i + 1] = orders_list[i + 1], orders_list[i]
+            return OrderedDict(orders_list)
+    return orders
+
+
+DICT_AGENTS = {"setups_agent": dict_setups_agent, "low_priority_agent": dict_low_priority_agent,
+               "delays_agent": dict_delays_agent}
+
+
+def check_agents(table, steps, rng):
+    """ Run randomly picked agents on a dict schedule and a Schedule side by side """
+
+    orders = table.to_orders(rng.sample(range(len(table)), len(table)))
+    sol = Schedule.from_orders(orders, table)
+    for name in OBJECTIVES:
+        getattr(pp, name)(sol)
+
+    for step in range(steps):
+        agent = rng.choice(sorted(DICT_AGENTS))
+        orders = DICT_AGENTS[agent]([orders])
+        sol = getattr(pp, agent)([sol.copy()])
+        if sol.order_ids() != list(orders.keys()):
+            raise AssertionError("step %d: %s schedules differ" % (step, agent))
+
+        expected = {"setups": pp.setups_orders(orders), "low_priority": pp.low_priority_orders(orders),
+                    "delays": pp.delays_orders(orders)}
+        scores = {name: getattr(pp, name)(sol) for name in OBJECTIVES}
+        if scores != expected:
+            raise AssertionError("step %d: %s scores %s != dict scores %s" % (step, agent, scores, expected))
+
+
+def main():
+    parser = ArgumentParser(description="Check delta evaluation and agents against full re-scoring")
+    parser.add_argument('--moves', type=int, default=20000, help='random moves in total')
+    parser.add_argument('--steps', type=int, default=300, help='agent steps per order book')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    rng = rand.Random(args.seed)
+    books = list(tables(args.seed))
+    for name, table in books:
+        check_moves(table, args.moves // len(books), rng)
+        # the dict low priority objective needs a HIGH order, as the original did
+        if table.is_high.any():
+            check_agents(table, args.steps, rng)
+        print("ok:", name, "(%d orders)" % len(table))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+@file: checkpoint.py: Crash-safe checkpoints for Evo populations
+A checkpoint directory holds
+    snapshot.pkl  the compacted population, only ever replaced atomically
+    log-*.bin     one append-only log per run of the solutions it accepted since
+                  its last compaction
+    lock          taken while the snapshot is replaced
+    identity      what the checkpointed solutions belong to (e.g. an order book digest)
+Each log record is length-prefixed and checksummed, so a record torn by an
+interrupted write is detected and cut off when the checkpoint is loaded.
+A run only appends to its own log, which it keeps locked for as long as it runs,
+so runs sharing a directory never write into each other's files. Compaction
+folds the logs of runs that have ended (their lock is free) into the snapshot.
+"""
+
+import fcntl
+import os
+import pickle
+import struct
+import tempfile
+import zlib
+
+_HEADER = struct.Struct('<II')  # payload length, crc32 of the payload
+
+
+class CheckpointStore:
+    """ Snapshot + per-run append-only logs of (eval, encoded solution) records """
+
+    def __init__(self, path, encode=None, decode=None, compact_every=10, durable=True, identity=None):
+        """ path is the checkpoint directory (created if missing)
+        encode / decode convert a solution to and from its compact stored form
+        compact_every defines how many appends are logged before compaction is due
+        durable forces every write to disk (fsync) before returning
+        identity (a string) names what the solutions belong to: it is recorded in a new
+        directory, and a directory recorded for a different identity raises ValueError """
+
+        self.path = path
+        self.encode = encode if encode is not None else (lambda sol: sol)
+        self.decode = decode if decode is not None else (lambda data: data)
+        self.compact_every = compact_every
+        self.durable = durable
+        self.appends = 0
+        self.log = None # This run's log: (path, locked file descriptor), created on the first append
+        self.seen = None # Identity of the snapshot this run last read or wrote
+        os.makedirs(path, exist_ok=True)
+        if identity is not None:
+            self._check_identity(identity)
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.path, 'snapshot.pkl')
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.path, 'lock')
+
+    def log_paths(self):
+        """ Paths of every run's log in the checkpoint directory """
+
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                      if name.startswith('log-') and name.endswith('.bin'))
+
+    def append(self, items):
+        """ Log (eval, solution) pairs. Cost scales with the number of new solutions """
+
+        items = list(items)
+        if len(items) == 0:
+            return
+
+        frames = []
+        for eval, sol in items:
+            payload = pickle.dumps((eval, self.encode(sol)), protocol=pickle.HIGHEST_PROTOCOL)
+            frames.append(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+
+        fd = self._log_fd()
+        os.write(fd, b''.join(frames))
+        if self.durable:
+            os.fsync(fd)
+        self.appends += 1
+
+    def needs_compaction(self):
+        """ Have enough appends been logged since the last compaction? """
+
+        return self.appends >= self.compact_every
+
+    def compact(self, items):
+        """ Replace the snapshot with the given (eval, solution) pairs and empty this run's log
+        Records of ended runs' logs (which are then removed) and of a snapshot another run
+        wrote since this run last read it are kept too. A crash in between leaves logs to be
+        replayed onto the new snapshot, which is harmless because replaying into an archive
+        is idempotent """
+
+        records = [(eval, self.encode(sol)) for eval, sol in items]
+        with _Locked(self.lock_path):
+            if self._identity() != self.seen:
+                records.extend(self._read_snapshot())
+            ended = []
+            for path in self.log_paths():
+                fd = None if self.log is not None and path == self.log[0] else _try_lock(path)
+                if fd is not None:
+                    records.extend(_read_log(_read(path))[0])
+                    ended.append((path, fd))
+
+            self._replace(self.snapshot_path, pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL))
+            self.seen = self._identity()
+            for path, fd in ended:
+                os.unlink(path)
+                os.close(fd)
+            if self.log is not None:
+                os.ftruncate(self.log[1], 0)
+                os.lseek(self.log[1], 0, os.SEEK_SET)
+        self.appends = 0
+
+    def load(self):
+        """ All (eval, solution) pairs in the checkpoint: the snapshot, then every log in order
+        The torn tail left in the log of a run that crashed is cut off """
+
+        items = self._read_snapshot()
+        self.seen = self._identity()
+        for path in self.log_paths():
+            data = _read(path)
+            records, end = _read_log(data)
+            items.extend(records)
+            if end < len(data):
+                fd = _try_lock(path)
+                if fd is not None:
+                    os.ftruncate(fd, end)
+                    os.close(fd)
+
+        return [(eval, self.decode(data)) for eval, data in items]
+
+    def restore(self, evo):
+        """ Resume: add every checkpointed solution to the population of evo """
+
+        for eval, sol in self.load():
+            evo.pop.insert(eval, sol)
+
+    def close(self):
+        """ Release this run's log, so that a later compaction may fold it into the snapshot """
+
+        if self.log is not None:
+            os.close(self.log[1])
+            self.log = None
+
+    def _log_fd(self):
+        """ This run's log, created and locked (for the life of the run) on first use """
+
+        if self.log is None:
+            # locked under a hidden name first, so no compaction takes it for an ended run's log
+            fd, tmp = tempfile.mkstemp(prefix='.log-', suffix='.bin', dir=self.path)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            path = os.path.join(self.path, os.path.basename(tmp)[1:])
+            os.rename(tmp, path)
+            self.log = (path, fd)
+        return self.log[1]
+
+    def _check_identity(self, identity):
+        """ Record identity in the directory, or check that it is the recorded one """
+
+        path = os.path.join(self.path, 'identity')
+        with _Locked(self.lock_path):
+            if not os.path.exists(path):
+                self._replace(path, identity.encode())
+        recorded = _read(path).decode()
+        if recorded != identity:
+            raise ValueError("checkpoint %s holds solutions for %s, not %s" % (self.path, recorded, identity))
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return []
+        with open(self.snapshot_path, 'rb') as file:
+            return pickle.load(file)
+
+    def _identity(self):
+        """ (inode, mtime) of the snapshot, which changes whenever it is replaced """
+
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _replace(self, path, data):
+        """ Atomically replace a file: write a uniquely named temporary file, then rename it over the target """
+
+        fd, tmp = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+                if self.durable:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class _Locked:
+    """ Holds an exclusive lock on a lock file for the duration of a with block """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        os.close(self.fd)
+
+
+def _try_lock(path):
+    """ A locked descriptor of another run's log if that run has ended, otherwise None """
+
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _read(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def _read_log(data):
+    """ Decode log records, stopping at the first truncated or corrupt one
+    Returns the records and the offset at which the valid records end """
+
+    records = []
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, pos)
+        payload = data[pos + _HEADER.size:pos + _HEADER.size + length]
+        if length == 0 or len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(pickle.loads(payload))
+        pos += _HEADER.size + length
+    return records, pos
@@ -7,20 +7,45 @@ Assumes no Solutions class.
 
 import random as rand
 import copy
-from functools import reduce
-import pickle
-import csv
+from collections import OrderedDict
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
+import os
+import queue
+import multiprocessing as mp
+import time
+import traceback
+import pareto
+from instrument import Profiler
+from scheduler import UniformScheduler
+from export import export_front
+from metrics import HypervolumeTracker
 
 class Evo:
 
-    def __init__(self):
-        """ Population constructor """
-        self.pop = {} # The solution population eval -> solution
+    def __init__(self, copier=copy.deepcopy, stacker=list, scheduler=None,
+                 fingerprint=None, cache_size=100000, duplicates=1):
+        """ Population constructor
+        copier makes the private copy of a solution that an agent is allowed to modify
+        stacker turns a list of solutions into the batch passed to batch fitness functions
+        scheduler decides which agents run (default: uniformly random, see scheduler.py)
+        fingerprint maps a solution to a hashable key; the last cache_size fingerprints
+        are remembered and re-discovered solutions skip fitness evaluation
+        duplicates defines how many distinct solutions are kept per evaluation """
+        self.pop = pareto.ParetoArchive(duplicates=duplicates) # The non-dominated solution population eval -> solution
         self.fitness = {} # Registered fitness functions: name -> objective function
+        self.batched = set() # Names of fitness functions that score a whole batch at once
         self.agents = {}  # Registered agents:  name -> (operator, num_solutions_input)
+        self.copier = copier
+        self.stacker = stacker
+        self.journal = None # Solutions accepted since the last checkpoint (None = not checkpointing)
+        self.hooks = [] # Instrumentation callbacks: hook(event, **info)
+        self.scheduler = scheduler if scheduler is not None else UniformScheduler()
+        self.fingerprint = fingerprint
+        self.cache_size = cache_size
+        self.seen = OrderedDict() # LRU cache of recently evaluated solutions: fingerprint -> eval
+        self.evaluations = 0 # Number of solutions scored so far
 
     def size(self):
         """ The size of the current population """
@@ -28,12 +53,17 @@ class Evo:
         size = len(self.pop)
         return size
 
-    def add_fitness_criteria(self, name, f):
+    def add_fitness_criteria(self, name, f, batch=False):
         """ Register a fitness criterion (objective) with the
         environment. Any solution added to the environment is scored 
-        according to this objective """
+        according to this objective.
+        A batch criterion takes a stack of K solutions and returns K scores """
         
         self.fitness[name] = f
+        if batch:
+            self.batched.add(name)
+        else:
+            self.batched.discard(name)
         
     def add_agent(self, name, op, k=1):
         """ Register a named agent with the population.
@@ -42,58 +72,283 @@ class Evo:
         
         self.agents[name] = (op, k)
 
+    def add_hook(self, hook):
+        """ Register an instrumentation callback, called as hook(event, **info) with events
+        agent (name, seconds, accepted), fitness (name, seconds, count) and iteration (iteration, size).
+        An agent's offspring is accepted when it enters the front as a new evaluation; offspring
+        scoring the same as a member are stored but not counted as accepted.
+        Nothing is timed while no hooks are registered """
+
+        self.hooks.append(hook)
+
+    def enable_profiling(self, every=100):
+        """ Register and return a Profiler that records front size every `every` iterations """
+
+        profiler = Profiler(every)
+        self.add_hook(profiler)
+        return profiler
+
+    def track_hypervolume(self, ref):
+        """ Register and return a HypervolumeTracker whose value follows the population's
+        hypervolume (w.r.t. the reference point ref) as solutions enter and leave it """
+
+        tracker = HypervolumeTracker(ref, self.pop.scores())
+        self.pop.add_listener(tracker)
+        return tracker
+
+    def _emit(self, event, **info):
+        for hook in self.hooks:
+            hook(event, **info)
+
+    def _timed(self, name, f, arg, count):
+        """ Call a fitness function, reporting its wall time to the hooks """
+
+        start = time.perf_counter()
+        scores = f(arg)
+        self._emit("fitness", name=name, seconds=time.perf_counter() - start, count=count)
+        return scores
+
     def add_solution(self, sol):
-        """ Add a solution to the population """
+        """ Add a solution to the population.
+        Returns what the population did with it: pareto.REJECTED (dominated), pareto.ENTERED
+        (a new evaluation on the front) or pareto.STORED (kept for an evaluation already on it) """
         
-        eval = tuple((name, f(sol)) for name, f in self.fitness.items())
-        self.pop[eval] = sol
+        if self.batched or self.fingerprint is not None:
+            return self.add_solutions([sol])[0]
+
+        if self.hooks:
+            eval = tuple((name, self._timed(name, f, sol, 1)) for name, f in self.fitness.items())
+        else:
+            eval = tuple((name, f(sol)) for name, f in self.fitness.items())
+        self.evaluations += 1
+        return self._insert(eval, sol)
+
+    def _insert(self, eval, sol):
+        """ Insert an evaluated solution into the population, journaling it if it was kept
+        Returns the archive's status (see add_solution) """
+
+        status = self.pop.insert(eval, sol)
+        if status and self.journal is not None:
+            self.journal.append((eval, sol))
+        return status
+
+    def add_solutions(self, sols):
+        """ Score a batch of solutions (one call per batch criterion) and add them to the population.
+        Returns the status of each solution (see add_solution).
+        Solutions already in the fingerprint cache are neither scored nor added again (REJECTED) """
+
+        if self.fingerprint is None:
+            evals = self._evaluate(sols)
+            return [self._insert(eval, sol) for eval, sol in zip(evals, sols)]
+
+        # a re-discovered solution is either already in the front or dominated, so skip it
+        fresh = {} # fingerprint -> index in sols of the solutions to score
+        for i, sol in enumerate(sols):
+            fp = self.fingerprint(sol)
+            if fp in self.seen:
+                self.seen.move_to_end(fp)
+            elif fp not in fresh:
+                fresh[fp] = i
+
+        statuses = [pareto.REJECTED] * len(sols)
+        evals = self._evaluate([sols[i] for i in fresh.values()])
+        for (fp, i), eval in zip(fresh.items(), evals):
+            self.seen[fp] = eval
+            statuses[i] = self._insert(eval, sols[i])
+
+        # forget the least recently seen fingerprints
+        while len(self.seen) > self.cache_size:
+            self.seen.popitem(last=False)
+        return statuses
+
+    def _evaluate(self, sols):
+        """ Evaluations of a list of solutions, scoring batch criteria in one call each """
+
+        if len(sols) == 0:
+            return []
+        self.evaluations += len(sols)
+
+        # one column of scores per criterion
+        columns = []
+        stack = self.stacker(sols) if self.batched else None
+        for name, f in self.fitness.items():
+            if name in self.batched:
+                scores = self._timed(name, f, stack, len(sols)) if self.hooks else f(stack)
+                columns.append(scores.tolist() if hasattr(scores, 'tolist') else list(scores))
+            elif self.hooks:
+                columns.append([self._timed(name, f, sol, 1) for sol in sols])
+            else:
+                columns.append([f(sol) for sol in sols])
+
+        names = list(self.fitness.keys())
+        return [tuple(zip(names, row)) for row in zip(*columns)]
 
     def run_agent(self, name):
-        """ Invoke an agent against the population """
+        """ Invoke an agent against the population.
+        Returns the status of its offspring (see add_solution) """
         
         op, k = self.agents[name]
+        if not self.hooks:
+            picks = self.get_random_solutions(k)
+            new_sol = op(picks)
+            return self.add_solution(new_sol)
+
+        start = time.perf_counter()
         picks = self.get_random_solutions(k)
         new_sol = op(picks)
-        self.add_solution(new_sol)
+        seconds = time.perf_counter() - start
+        status = self.add_solution(new_sol)
+        self._emit("agent", name=name, seconds=seconds, accepted=status == pareto.ENTERED)
+        return status
+
+    def run_agents(self, names):
+        """ Invoke several agents against the population and score their offspring as one batch.
+        Returns the status of each agent's offspring (see add_solution) """
+
+        offspring = []
+        seconds = []
+        for name in names:
+            op, k = self.agents[name]
+            start = time.perf_counter() if self.hooks else 0.0
+            offspring.append(op(self.get_random_solutions(k)))
+            if self.hooks:
+                seconds.append(time.perf_counter() - start)
+        statuses = self.add_solutions(offspring)
+
+        if self.hooks:
+            for name, secs, status in zip(names, seconds, statuses):
+                self._emit("agent", name=name, seconds=secs, accepted=status == pareto.ENTERED)
+        return statuses
 
-    def evolve(self, n=1, dom=100, status=100, sync=1000):
+    def evolve(self, n=1, status=100, sync=1000, batch=1, checkpoint=None, reporter=None, stop=None):
         """ Run n random agents (default=1) 
-        dom defines how often we remove dominated (unfit) solutions
-        status defines how often we display the current population """
+        status defines how often we display progress (None = never)
+        sync defines how often we write new solutions to the checkpoint store (None = never)
+        batch defines how many offspring are generated before they are scored together
+        reporter renders plots and exports of the front in the background (see reporter.py)
+        stop ends the run early, checked after every batch (see stopping.py);
+        with a stop criterion n may be None to run until it is met
+        The population is kept non-dominated as solutions are added.
+        Returns the number of agents run """
         
+        if checkpoint is not None and self.journal is None:
+            self.journal = []
+        if n is None and stop is None:
+            raise ValueError("evolve needs an iteration count or a stop criterion")
+        if stop is not None:
+            stop.start(self)
+
         agent_names = list(self.agents.keys())
-        for i in range(n):
-            pick = rand.choice(agent_names)
-            self.run_agent(pick)
+        i = 0
+        while n is None or i < n:
+            size = batch if n is None else min(batch, n - i)
 
-            if i % sync == 0:
-                # merge the saved solutions into my populations
-                try:
-                    with open('solutions.dat', 'rb') as file:
-                        loaded = pickle.load(file)
-                        for eval, sol in loaded.items():
-                            self.pop[eval] = sol
-                except Exception as e:
-                    print(e)
+            # the scheduler is rewarded only when an agent's offspring changes the front in
+            # score space, not when it merely re-scores the same as a member
+            if batch == 1:
+                pick = self.scheduler.pick(agent_names)[0]
+                self.scheduler.update(pick, int(self.run_agent(pick) == pareto.ENTERED))
+            else:
+                picks = self.scheduler.pick(agent_names, k=size)
+                for pick, status in zip(picks, self.run_agents(picks)):
+                    self.scheduler.update(pick, int(status == pareto.ENTERED))
 
-                # remove dominated
-                self.remove_dominated()
+            if self.hooks:
+                self._emit("iteration", iteration=i + size, size=self.size())
 
-                # resave the population back to the disk
-                with open('solutions.dat', 'wb') as file:
-                    pickle.dump(self.pop, file)
+            # i % x < batch: a multiple of x was reached within this batch
+            if checkpoint is not None and sync and i % sync < batch:
+                self.checkpoint(checkpoint)
 
-            if i % dom == 0:
-                self.remove_dominated()
+            if reporter is not None and reporter.due(i, batch):
+                reporter.submit(i, self.fitness.keys(), self.pop.scores().copy())
 
-            if i % status == 0:
-                self.remove_dominated()
+            if status and i % status < batch:
                 print("Iteration:", i)
                 print("Population size:", self.size())
-                print(self)
+                print("Best scores:", self.best())
+
+            i += size
+            if stop is not None and stop.done(self, i):
+                break
 
-        # clean up the population
-        self.remove_dominated()
+        if checkpoint is not None:
+            self.checkpoint(checkpoint)
+
+        if reporter is not None:
+            reporter.submit(i, self.fitness.keys(), self.pop.scores().copy())
+            reporter.close()
+        return i
+
+    def best(self):
+        """ The best score found so far for each objective: name -> score """
+
+        scores = self.pop.scores()
+        if len(scores) == 0:
+            return {}
+        return dict(zip(self.fitness.keys(), scores.min(axis=0).tolist()))
+
+    def checkpoint(self, store):
+        """ Append the solutions accepted since the last checkpoint to the store,
+        compacting it to the current population when due """
+
+        store.append(self.journal or [])
+        self.journal = []
+        if store.needs_compaction():
+            store.compact(self.pop.items())
+
+    def evolve_parallel(self, n=1, workers=None, migrate=500, migrants=5, seed=None, batch=1):
+        """ Run n random agents on each of workers island populations (default: one per core)
+        Every migrate iterations each island sends up to migrants members of its front
+        to the next island in a ring. The island fronts are merged into this population.
+        An error in an island (or an island that dies) stops every island and is raised here """
+
+        if workers is None:
+            workers = os.cpu_count()
+        if seed is None:
+            seed = rand.randrange(2 ** 32)
+
+        # island i receives migrants from island i - 1 through its inbox
+        ctx = mp.get_context()
+        inboxes = [ctx.Queue() for _ in range(workers)]
+        results = ctx.Queue()
+        islands = [ctx.Process(target=_island,
+                               args=(self, i, n, migrate, migrants, batch, seed + i,
+                                     inboxes[i], inboxes[(i + 1) % workers], results))
+                   for i in range(workers)]
+        for island in islands:
+            island.start()
+
+        # collect every front before joining so no island blocks on a full pipe
+        done = set() # islands whose front has been merged
+        exited = set() # islands seen to have exited while no result was waiting
+        try:
+            while len(done) < workers:
+                try:
+                    index, items, evaluations, error = results.get(timeout=1.0)
+                except queue.Empty:
+                    # a result may still be in flight when its island exits, so give it one more wait
+                    for i, island in enumerate(islands):
+                        if i not in done and island.exitcode is not None:
+                            if i in exited:
+                                raise RuntimeError("island %d exited with code %d without a result"
+                                                   % (i, island.exitcode))
+                            exited.add(i)
+                    continue
+                if error is not None:
+                    raise RuntimeError("island %d failed:\n%s" % (index, error))
+                done.add(index)
+                self.evaluations += evaluations
+                for eval, sol in items:
+                    self._insert(eval, sol)
+        finally:
+            for island in islands:
+                if island.is_alive() and len(done) < workers:
+                    island.terminate()
+                island.join()
+
+        if self.hooks:
+            self._emit("iteration", iteration=n, size=self.size())
 
     def get_random_solutions(self, k=1):
         """ Pick k random solutions from the population """
@@ -101,59 +356,58 @@ class Evo:
         if self.size() == 0:
             return []
         else:
-            solutions = tuple(self.pop.values())
-            rand_sols = [copy.deepcopy(rand.choice(solutions)) for _ in range(k)]
+            rand_sols = [self.copier(self.pop.choice()) for _ in range(k)]
             return rand_sols
 
     @staticmethod
     def _dominates(p, q):
         """ p = evaluation of solution: ((obj1, score1), (obj2, score2), ... )"""
-        
-        pscores = [score for _,score in p]
-        qscores = [score for _,score in q]
-        score_diffs = list(map(lambda x,y: y-x, pscores, qscores))
-        min_diff = min(score_diffs)
-        max_diff = max(score_diffs)
-        return min_diff >= 0.0 and max_diff > 0.0
 
-    @staticmethod
-    def _reduce_nds(S, p):
-        return S - {q for q in S if Evo._dominates(p, q)}
+        return pareto.dominates(pareto.score_matrix([p])[0], pareto.score_matrix([q])[0])
 
     def remove_dominated(self):
-        """ Remove dominated solutions """
-        
-        nds = reduce(Evo._reduce_nds, self.pop.keys(), self.pop.keys())
-        self.pop = {k: self.pop[k] for k in nds}
+        """ Remove dominated solutions.
+        The archive never holds dominated solutions, so this only filters
+        populations that were assigned directly as a plain dict """
+
+        if isinstance(self.pop, pareto.ParetoArchive):
+            return
+
+        keys = list(self.pop.keys())
+        if len(keys) == 0:
+            return
+        scores = pareto.score_matrix(keys)
+
+        mask = pareto.non_dominated(scores)
+        self.pop = pareto.ParetoArchive((k, self.pop[k]) for k, keep in zip(keys, mask) if keep)
+
+    def ranks(self):
+        """ Pareto rank of every solution (0 = non-dominated): eval -> rank """
+
+        keys = list(self.pop.keys())
+        ranks = pareto.non_dominated_sort(pareto.score_matrix(keys))
+        return dict(zip(keys, ranks.tolist()))
 
     def __str__(self):
         """ Output the solutions in the population """
 
-        rslt = ""
-        for eval,sol in self.pop.items():
-            rslt += str(dict(eval))+":\t"+str(sol)+"\n"
-        return rslt
+        return "".join(str(dict(eval)) + ":\t" + str(sol) + "\n" for eval, sol in self.pop.items())
 
-    def save_solutions(self):
-        """ Save the solutions in the population in a csv file """
+    def save_solutions(self, filename="solutions.csv", encode=None, teamname=None, chunk=10000):
+        """ Save the solutions in the population, streaming chunk rows at a time (see export.py)
+        The format follows the extension: .csv, .parquet, or a directory of memory-mappable .npy files
+        encode maps a solution to integers to export alongside its scores
+        teamname adds a leading teamname column to csv files """
 
-        # wrtie to a csv file
-        with open("solutions.csv", "w") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["teamname", "setups", "lowpriority", "delays"])
-            for key in self.pop.keys():
-                # export setups, lowpriority, and delays data to csv
-                writer.writerow(["NukalaSRiveraA", key[0][1], key[1][1], key[2][1]])
+        prefix = ("teamname", teamname) if teamname else None
+        export_front(self.pop, filename, names=list(self.fitness.keys()), encode=encode,
+                     chunk=chunk, prefix=prefix)
 
     def visualize(self):
         """ Create two visualizations to show the tradeoffs between agents: 3D scatterplot and pairplot """
 
-        # copy the solutions to not mess them up
-        population = copy.deepcopy(self.pop)
-
-        # put the solutions into a dataframe for plotting
-        data = [[key[0][1], key[1][1], key[2][1]] for key in population.keys()]
-        df = pd.DataFrame(data=data, columns = ["setups", "low priority", "delays"]) 
+        # put the scores (not the solutions) into a dataframe for plotting
+        df = pd.DataFrame(data=self.pop.scores(), columns = ["setups", "low priority", "delays"]) 
         setup = df["setups"]
         priority = df["low priority"]
         delay = df["delays"]
@@ -164,4 +418,43 @@ class Evo:
         ax.scatter(setup, priority, delay)
         plt.savefig('3D Scatterplot')
         sns.pairplot(data=df)
-        plt.savefig('Pairplot')
\ No newline at end of file
+        plt.savefig('Pairplot')
+
+
+def _island(evo, index, n, migrate, migrants, batch, seed, inbox, outbox, results):
+    """ Evolve one island population in a worker process and send back
+    (index, front, evaluations, None), or (index, None, 0, traceback) if it fails """
+
+    try:
+        _evolve_island(evo, n, migrate, migrants, batch, seed, inbox, outbox)
+    except BaseException:
+        results.put((index, None, 0, traceback.format_exc()))
+    else:
+        results.put((index, evo.pop.items(), evo.evaluations, None))
+
+
+def _evolve_island(evo, n, migrate, migrants, batch, seed, inbox, outbox):
+    """ Run an island: evolve, emigrating and immigrating every migrate iterations """
+
+    rand.seed(seed)
+    evo.evaluations = 0
+    evo.journal = None
+
+    # migrants still buffered when the next island finishes are simply dropped
+    outbox.cancel_join_thread()
+
+    for start in range(0, n, migrate):
+        evo.evolve(min(migrate, n - start), status=None, sync=None, batch=batch)
+
+        # emigrate a random sample of the front
+        items = evo.pop.items()
+        outbox.put(rand.sample(items, min(migrants, len(items))))
+
+        # immigrate whatever has arrived so far
+        while True:
+            try:
+                arrivals = inbox.get_nowait()
+            except queue.Empty:
+                break
+            for eval, sol in arrivals:
+                evo._insert(eval, sol)
@@ -0,0 +1,135 @@
+"""
+@file: export.py: Streaming export of Pareto fronts
+Writes any number of objectives plus an optional encoded solution (e.g. the
+order permutation) in chunks, so large fronts are never formatted in memory
+all at once. Formats are chosen by file extension:
+    .csv       one row per solution, the encoding as space-separated integers
+    .parquet   Arrow/Parquet row groups (requires pyarrow)
+    otherwise  a directory of .npy arrays that load_front memory-maps lazily
+"""
+
+import csv
+import json
+import os
+from itertools import groupby
+
+import numpy as np
+
+
+def export_front(pop, path, names=None, encode=None, chunk=10000, prefix=None):
+    """ Export an archive (or eval -> solution mapping) to path
+    names are the objective names (default: taken from the evaluations)
+    encode maps a solution to a sequence of integers (default: solutions are not exported)
+    prefix is an optional (column name, value) written as the first column of CSV exports
+    Every solution is a row: an archive keeping several solutions per evaluation
+    (Evo(duplicates=k)) repeats that evaluation's scores for each of them """
+
+    items = list(pop.all_items() if hasattr(pop, 'all_items') else pop.items())
+    if names is None:
+        names = [name for name, _ in items[0][0]] if items else []
+    if hasattr(pop, 'scores'):
+        scores = pop.scores()
+        if len(items) > len(scores):
+            # the extra solutions of an evaluation follow its first one
+            repeats = [len(list(group)) for _, group in groupby(eval for eval, _ in items)]
+            scores = np.repeat(scores, repeats, axis=0)
+    else:
+        scores = np.array([[s for _, s in eval] for eval, _ in items])
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        _export_csv(items, scores, path, names, encode, chunk, prefix)
+    elif ext == '.parquet':
+        _export_parquet(items, scores, path, names, encode, chunk)
+    else:
+        _export_npy(items, scores, path, names, encode, chunk)
+
+
+def _chunks(items, scores, chunk):
+    """ (solutions, scores) slices of at most chunk rows """
+
+    for start in range(0, len(items), chunk):
+        yield [sol for _, sol in items[start:start + chunk]], scores[start:start + chunk]
+
+
+def _export_csv(items, scores, path, names, encode, chunk, prefix):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        header = list(names) + (['solution'] if encode else [])
+        if prefix:
+            header.insert(0, prefix[0])
+        writer.writerow(header)
+
+        # integer objectives (like the production planning ones) are written without decimals
+        integral = bool(np.all(scores == np.round(scores)))
+        for sols, block in _chunks(items, scores, chunk):
+            rows = block.astype(np.int64).tolist() if integral else block.tolist()
+            if encode:
+                rows = [row + [' '.join(map(str, np.asarray(encode(sol)).tolist()))]
+                        for row, sol in zip(rows, sols)]
+            if prefix:
+                rows = [[prefix[1]] + row for row in rows]
+            writer.writerows(rows)
+
+
+def _export_parquet(items, scores, path, names, encode, chunk):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow; use a .csv path or a directory instead")
+
+    fields = [pa.field(name, pa.float64()) for name in names]
+    if encode:
+        fields.append(pa.field('solution', pa.list_(pa.int32())))
+    schema = pa.schema(fields)
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for sols, block in _chunks(items, scores, chunk):
+            columns = [pa.array(block[:, k]) for k in range(len(names))]
+            if encode:
+                columns.append(pa.array([np.asarray(encode(sol), dtype=np.int32) for sol in sols],
+                                        type=pa.list_(pa.int32())))
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+
+def _export_npy(items, scores, path, names, encode, chunk):
+    os.makedirs(path, exist_ok=True)
+    n = len(items)
+
+    # preallocate the arrays on disk and fill them chunk by chunk
+    scores_out = np.lib.format.open_memmap(os.path.join(path, 'scores.npy'), mode='w+',
+                                           dtype=np.float64, shape=(n, len(names)))
+    sols_out = None
+    if encode:
+        width = len(encode(items[0][1])) if n else 0
+        sols_out = np.lib.format.open_memmap(os.path.join(path, 'solutions.npy'), mode='w+',
+                                             dtype=np.int32, shape=(n, width))
+
+    start = 0
+    for sols, block in _chunks(items, scores, chunk):
+        scores_out[start:start + len(sols)] = block
+        if sols_out is not None:
+            sols_out[start:start + len(sols)] = [np.asarray(encode(sol)) for sol in sols]
+        start += len(sols)
+
+    scores_out.flush()
+    if sols_out is not None:
+        sols_out.flush()
+
+    with open(os.path.join(path, 'meta.json'), 'w') as file:
+        json.dump({'names': list(names), 'size': n, 'solutions': bool(encode)}, file)
+
+
+def load_front(path):
+    """ Load a front exported to a directory: {'names', 'scores', 'solutions'} with the
+    arrays memory-mapped read-only, so only the rows that are touched are read """
+
+    with open(os.path.join(path, 'meta.json')) as file:
+        meta = json.load(file)
+    front = {'names': meta['names'],
+             'scores': np.load(os.path.join(path, 'scores.npy'), mmap_mode='r'),
+             'solutions': None}
+    if meta['solutions']:
+        front['solutions'] = np.load(os.path.join(path, 'solutions.npy'), mmap_mode='r')
+    return front
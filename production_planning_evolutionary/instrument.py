@@ -0,0 +1,65 @@
+"""
+@file: instrument.py: Instrumentation hooks for the Evo framework
+A Profiler is an Evo hook (see Evo.add_hook) that aggregates call counts,
+wall time and acceptance rates per agent and per fitness function, and
+records the front size as the population evolves.
+"""
+
+
+class Profiler:
+    """ Evo hook aggregating per-agent and per-objective statistics """
+
+    def __init__(self, every=100):
+        """ every defines how often (in iterations) the front size is recorded """
+
+        self.every = every
+        self.agents = {}  # name -> [calls, seconds, accepted]
+        self.fitness = {}  # name -> [calls, seconds, solutions scored]
+        self.front = []  # (iteration, front size)
+        self._next = 0
+
+    def __call__(self, event, **info):
+        if event == "agent":
+            stats = self.agents.setdefault(info["name"], [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += info["seconds"]
+            stats[2] += info["accepted"]
+        elif event == "fitness":
+            stats = self.fitness.setdefault(info["name"], [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += info["seconds"]
+            stats[2] += info["count"]
+        elif event == "iteration" and info["iteration"] >= self._next:
+            self.front.append((info["iteration"], info["size"]))
+            self._next = info["iteration"] + self.every
+
+    def acceptance(self, name):
+        """ Fraction of an agent's offspring that entered the front as a new evaluation
+        (offspring scoring the same as a front member do not count) """
+
+        calls, _, accepted = self.agents.get(name, (0, 0.0, 0))
+        return accepted / calls if calls else 0.0
+
+    def as_dict(self):
+        """ All statistics as plain data (e.g. for JSON) """
+
+        return {"agents": {name: {"calls": calls, "seconds": seconds, "accepted": accepted}
+                           for name, (calls, seconds, accepted) in self.agents.items()},
+                "fitness": {name: {"calls": calls, "seconds": seconds, "scored": scored}
+                            for name, (calls, seconds, scored) in self.fitness.items()},
+                "front": self.front}
+
+    def summary(self):
+        """ Short text report of the statistics """
+
+        lines = ["%-20s %8s %10s %10s" % ("agent", "calls", "seconds", "accepted")]
+        for name, (calls, seconds, accepted) in self.agents.items():
+            lines.append("%-20s %8d %10.4f %9.1f%%" % (name, calls, seconds, 100 * self.acceptance(name)))
+
+        lines.append("%-20s %8s %10s %10s" % ("fitness", "calls", "seconds", "us/sol"))
+        for name, (calls, seconds, scored) in self.fitness.items():
+            lines.append("%-20s %8d %10.4f %10.2f" % (name, calls, seconds, 1e6 * seconds / max(scored, 1)))
+
+        if self.front:
+            lines.append("front size: " + " ".join("%d@%d" % (size, i) for i, size in self.front[-10:]))
+        return "\n".join(lines)
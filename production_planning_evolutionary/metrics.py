@@ -0,0 +1,210 @@
+"""
+@file: metrics.py: Front-quality metrics over (N x objectives) score matrices
+All objectives are minimized. The hypervolume is measured against a reference
+point that every counted solution must beat in every objective.
+"""
+
+import bisect
+
+import numpy as np
+
+import pareto
+
+
+def _inside(scores, ref):
+    """ The non-dominated rows of scores that strictly beat the reference point """
+
+    scores = np.asarray(scores, dtype=float).reshape(-1, len(ref))
+    scores = scores[np.all(scores < ref, axis=1)]
+    if len(scores) == 0:
+        return scores
+    return scores[pareto.non_dominated(scores)]
+
+
+class _Staircase:
+    """ Union of the boxes [x, rx] x [y, ry] of 2D points, with its area kept up to date """
+
+    def __init__(self, rx, ry):
+        self.rx, self.ry = rx, ry
+        self.xs, self.ys = [], []  # steps: x increasing, y strictly decreasing
+        self.area = 0.0
+
+    def add(self, x, y):
+        """ Add a point and return the area it adds to the union """
+
+        xs, ys = self.xs, self.ys
+        i = bisect.bisect_right(xs, x)
+        height = ys[i - 1] if i > 0 else self.ry  # covered height at x
+        if height <= y:
+            return 0.0
+
+        # walk right over the steps the new point covers
+        gain, left, j = 0.0, x, i
+        while j < len(xs) and ys[j] >= y:
+            gain += (xs[j] - left) * (height - y)
+            left, height = xs[j], ys[j]
+            j += 1
+        right = xs[j] if j < len(xs) else self.rx
+        gain += (right - left) * (height - y)
+
+        # a step at the same x is covered too
+        if i > 0 and xs[i - 1] == x:
+            i -= 1
+        xs[i:j] = [x]
+        ys[i:j] = [y]
+        self.area += gain
+        return gain
+
+
+def hypervolume(scores, ref, samples=100000, seed=None):
+    """ Volume dominated by the scores and bounded by the reference point
+    Exact for up to 3 objectives, a Monte Carlo estimate from samples points beyond that """
+
+    ref = np.asarray(ref, dtype=float)
+    points = _inside(scores, ref)
+    if len(points) == 0:
+        return 0.0
+
+    d = len(ref)
+    if d == 1:
+        return float(ref[0] - points[:, 0].min())
+    if d == 2:
+        stairs = _Staircase(ref[0], ref[1])
+        for x, y in points[np.argsort(points[:, 0])]:
+            stairs.add(x, y)
+        return stairs.area
+    if d == 3:
+        # sweep the third objective, growing the 2D staircase slice by slice
+        points = points[np.argsort(points[:, 2])]
+        stairs = _Staircase(ref[0], ref[1])
+        volume = 0.0
+        for k, (x, y, z) in enumerate(points):
+            stairs.add(x, y)
+            top = points[k + 1, 2] if k + 1 < len(points) else ref[2]
+            volume += stairs.area * (top - z)
+        return volume
+    return _hypervolume_mc(points, ref, samples, seed)
+
+
+def _hypervolume_mc(points, ref, samples, seed, chunk=10000):
+    """ Monte Carlo hypervolume: the dominated fraction of the box between the points and ref """
+
+    rng = np.random.default_rng(seed)
+    low = points.min(axis=0)
+    box = float(np.prod(ref - low))
+    hits = 0
+    for start in range(0, samples, chunk):
+        k = min(chunk, samples - start)
+        sample = rng.uniform(low, ref, size=(k, len(ref)))
+        hits += int(np.count_nonzero(_covered(points, sample)))
+    return box * hits / samples
+
+
+def _covered(points, sample, chunk=256):
+    """ Boolean mask of the samples weakly dominated by at least one point """
+
+    covered = np.zeros(len(sample), dtype=bool)
+    for start in range(0, len(sample), chunk):
+        s = sample[start:start + chunk][:, None, :]
+        covered[start:start + chunk] = np.any(np.all(points[None, :, :] <= s, axis=2), axis=1)
+    return covered
+
+
+def generational_distance(front, reference, p=2):
+    """ Generational distance: p-mean of the Euclidean distance from each front point
+    to the nearest point of a reference front (0 when the front lies on the reference) """
+
+    front = np.asarray(front, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    if len(front) == 0:
+        return 0.0
+    nearest = np.array([np.sqrt(((reference - f) ** 2).sum(axis=1)).min() for f in front])
+    return float((nearest ** p).sum() ** (1.0 / p) / len(front))
+
+
+def spacing(front):
+    """ Schott's spacing: standard deviation of each point's L1 distance to its nearest neighbour
+    (0 for perfectly evenly spread fronts) """
+
+    front = np.asarray(front, dtype=float)
+    n = len(front)
+    if n < 2:
+        return 0.0
+    nearest = np.empty(n)
+    for i in range(n):
+        dist = np.abs(front - front[i]).sum(axis=1)
+        dist[i] = np.inf
+        nearest[i] = dist.min()
+    return float(np.sqrt(((nearest.mean() - nearest) ** 2).sum() / (n - 1)))
+
+
+class HypervolumeTracker:
+    """ Hypervolume of an archive, following it as solutions enter and leave it
+    Entering and leaving only update the tracked set of points and mark the value
+    stale; the hypervolume is recomputed when value is next read (e.g. once per batch
+    by stopping.Stagnation), so any number of changes between reads costs one
+    computation. seed fixes the Monte Carlo samples beyond 3 objectives, so an
+    unchanged front always reads the same value """
+
+    def __init__(self, ref, scores=(), seed=0):
+        self.ref = np.asarray(ref, dtype=float)
+        self.seed = seed
+        self._points = {}  # score vector (tuple) -> how many times it is in the archive
+        self._value = 0.0
+        self._stale = False
+        for p in scores:
+            self.added(p)
+
+    @property
+    def points(self):
+        """ (N x objectives) matrix of the score vectors currently tracked """
+
+        rows = [p for p, count in self._points.items() for _ in range(count)]
+        return np.array(rows, dtype=float).reshape(-1, len(self.ref))
+
+    @property
+    def value(self):
+        if self._stale:
+            self.recompute()
+        return self._value
+
+    def contribution(self, p, others):
+        """ Volume dominated by p alone, given the points others """
+
+        p = np.asarray(p, dtype=float)
+        if not np.all(p < self.ref):
+            return 0.0
+        own = float(np.prod(self.ref - p))
+        if len(others) == 0:
+            return own
+        limited = np.maximum(np.asarray(others, dtype=float), p)
+        return own - hypervolume(limited, self.ref, seed=self.seed)
+
+    def added(self, p):
+        key = tuple(np.asarray(p, dtype=float).tolist())
+        self._points[key] = self._points.get(key, 0) + 1
+        self._stale = True
+
+    def removed(self, p):
+        key = tuple(np.asarray(p, dtype=float).tolist())
+        count = self._points.get(key, 0)
+        if count > 1:
+            self._points[key] = count - 1
+        elif count == 1:
+            del self._points[key]
+        self._stale = True
+
+    def __call__(self, event, scores):
+        """ ParetoArchive listener interface """
+
+        if event == "add":
+            self.added(scores)
+        elif event == "remove":
+            self.removed(scores)
+
+    def recompute(self):
+        """ Recompute the hypervolume of the tracked points now """
+
+        self._value = hypervolume(self.points, self.ref, seed=self.seed)
+        self._stale = False
+        return self._value
@@ -0,0 +1,167 @@
+"""
+@file: moves.py: Permutation moves for production schedules
+Every move edits a Schedule in place in O(1) or O(segment) time and updates the
+scores cached on it (setups, low_priority, delays) by delta evaluation, so the
+offspring of a move never needs a full re-score.
+"""
+
+import numpy as np
+
+
+def swap(sol, i, j):
+    """ Swap the orders at positions i and j """
+
+    if i == j:
+        return sol
+    i, j = min(i, j), max(i, j)
+    if j == i + 1:
+        return _exchange(sol, i, j, j + 1)
+
+    p = sol.perm
+    n = len(p)
+
+    # adjacent pairs broken and created by the swap
+    old, new = [], []
+    if i > 0:
+        old.append((p[i - 1], p[i]))
+        new.append((p[i - 1], p[j]))
+    old += [(p[i], p[i + 1]), (p[j - 1], p[j])]
+    new += [(p[j], p[i + 1]), (p[j - 1], p[i])]
+    if j < n - 1:
+        old.append((p[j], p[j + 1]))
+        new.append((p[i], p[j + 1]))
+
+    window = _low_priority_window(sol, i, j + 1)
+    p[i], p[j] = p[j], p[i]
+    _update(sol, old, new, i, window)
+    return sol
+
+
+def insert(sol, i, j):
+    """ Move the order at position i to position j """
+
+    if j > i:
+        return _exchange(sol, i, i + 1, j + 1)
+    if j < i:
+        return _exchange(sol, j, i, i + 1)
+    return sol
+
+
+def block_move(sol, i, j, k):
+    """ Move the block of orders at positions [i, j) in front of the order at position k
+    (k == len(sol) moves the block to the end) """
+
+    if k >= j:
+        return _exchange(sol, i, j, k)
+    if k <= i:
+        return _exchange(sol, k, i, j)
+    raise ValueError("cannot move a block inside itself")
+
+
+def reverse(sol, i, j):
+    """ Reverse the orders at positions [i, j) """
+
+    if j - i < 2:
+        return sol
+
+    p = sol.perm
+    n = len(p)
+
+    # the boundary pairs change, and every pair inside the block flips direction
+    old = [(p[i - 1], p[i])] if i > 0 else []
+    new = [(p[i - 1], p[j - 1])] if i > 0 else []
+    if j < n:
+        old.append((p[j - 1], p[j]))
+        new.append((p[i], p[j]))
+    inside = (p[i:j - 1].copy(), p[i + 1:j].copy())
+
+    window = _low_priority_window(sol, i, j)
+    p[i:j] = p[i:j][::-1].copy()
+    _update(sol, old, new, i, window, inside)
+    return sol
+
+
+def _exchange(sol, a, b, c):
+    """ Exchange the adjacent blocks [a, b) and [b, c) """
+
+    if not (a < b < c):
+        return sol
+
+    p = sol.perm
+    n = len(p)
+
+    # only the three pairs at the block boundaries change
+    old, new = [], []
+    if a > 0:
+        old.append((p[a - 1], p[a]))
+        new.append((p[a - 1], p[b]))
+    old.append((p[b - 1], p[b]))
+    new.append((p[c - 1], p[a]))
+    if c < n:
+        old.append((p[c - 1], p[c]))
+        new.append((p[b - 1], p[c]))
+
+    window = _low_priority_window(sol, a, c)
+    p[a:c] = np.concatenate((p[b:c], p[a:b]))
+    _update(sol, old, new, a, window)
+    return sol
+
+
+def _pair_costs(table, lefts, rights):
+    """ (setups, delays) contributed by the adjacent pairs lefts[t] -> rights[t] """
+
+    lefts = np.asarray(lefts, dtype=np.intp)
+    rights = np.asarray(rights, dtype=np.intp)
+    if len(lefts) == 0:
+        return 0, 0
+    setups = np.count_nonzero(table.product_code[lefts] != table.product_code[rights])
+    delays = table.quantity[lefts][table.order_id[lefts] > table.order_id[rights]].sum()
+    return int(setups), int(delays)
+
+
+def _low_priority_window(sol, lo, hi):
+    """ Copy of the positions [lo, hi) if the move can change the low_priority score, else None
+    Moves that stay entirely before or after the last high priority order leave it unchanged """
+
+    last_high = sol.scores.get("last_high")
+    if "low_priority" in sol.scores and last_high is not None and lo <= last_high < hi:
+        return sol.perm[lo:hi].copy()
+    return None
+
+
+def _update(sol, old, new, lo, window, inside=None):
+    """ Apply the score deltas of a move that replaced the adjacent pairs old with new
+    (plus the pairs inside a reversed block) and permuted the positions starting at lo """
+
+    scores = sol.scores
+    if not scores:
+        return
+    table = sol.table
+
+    if "setups" in scores or "delays" in scores:
+        old_lefts = [left for left, _ in old]
+        old_rights = [right for _, right in old]
+        new_lefts = [left for left, _ in new]
+        new_rights = [right for _, right in new]
+        if inside is not None:
+            old_lefts, old_rights = np.concatenate((old_lefts, inside[0])), np.concatenate((old_rights, inside[1]))
+            new_lefts, new_rights = np.concatenate((new_lefts, inside[1])), np.concatenate((new_rights, inside[0]))
+        old_setups, old_delays = _pair_costs(table, old_lefts, old_rights)
+        new_setups, new_delays = _pair_costs(table, new_lefts, new_rights)
+        if "setups" in scores:
+            scores["setups"] += new_setups - old_setups
+        if "delays" in scores:
+            scores["delays"] += new_delays - old_delays
+
+    if window is None:
+        return
+
+    # the last high priority order is still inside the window: re-sum only the window
+    before = window
+    after = sol.perm[lo:lo + len(window)]
+    last_high = scores["last_high"] - lo
+    new_last_high = len(after) - 1 - int(np.argmax(table.is_high[after][::-1]))
+    low_before = (table.quantity[before] * table.is_low[before])[:last_high].sum()
+    low_after = (table.quantity[after] * table.is_low[after])[:new_last_high].sum()
+    scores["low_priority"] += int(low_after - low_before)
+    scores["last_high"] = lo + new_last_high
@@ -0,0 +1,238 @@
+"""
+@file: orderbook.py: Seeded synthetic order books and order table loading
+Generates order books of any size (10k - 1M orders and beyond) with a
+configurable product mix and priority skew, streamed in chunks to either
+    .jsonl    one order per line: {"id", "priority", "product", "quantity"}
+    otherwise a columnar binary file (see write_binary)
+load_table reads any of these (and the original orders.json) straight into
+an OrderTable, without building a dict per order. Binary books are memory-mapped
+read-only, so every process planning over the same file shares one copy of
+the order attributes (see compile_table and open_table).
+
+$ python orderbook.py 1000000 orders_1m.bin --seed 7 --high 0.2
+"""
+
+import itertools
+import json
+import os
+import struct
+import tempfile
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+import numpy as np
+
+from schedule import OrderTable
+
+PRODUCTS = ["Laptop", "Chair", "GPU", "Floppy", "Plant"]
+PRIORITIES = ["HIGH", "LOW"]
+
+# binary layout: magic, header length, JSON header, then one 64-byte aligned array per column
+MAGIC = b"ORDBOOK1"
+_LENGTH = struct.Struct('<Q')
+_ALIGN = 64
+COLUMNS = (("order_id", "<i8"), ("product_code", "<i4"), ("priority_code", "i1"), ("quantity", "<i8"))
+
+_mapped = {}  # (path, size, mtime) -> OrderTable mapped from that file in this process
+
+
+def generate(n, seed=0, products=PRODUCTS, mix=None, high=0.5, quantity=(1, 100), chunk=100000):
+    """ Yield the order book in chunks of at most chunk orders, as dicts of columns
+    (order_id, product_code, priority_code, quantity). Order ids run from 1 to n.
+    mix gives the relative frequency of each product (default: uniform)
+    high is the fraction of HIGH priority orders
+    quantity is the inclusive (low, high) range of order quantities
+    The same seed always gives the same book, whatever the chunk size """
+
+    weights = np.ones(len(products)) if mix is None else np.asarray(mix, dtype=float)
+    weights = weights / weights.sum()
+
+    # every column has its own random stream so chunking does not change the draws
+    streams = [np.random.default_rng([seed, k]) for k in range(3)]
+    for start in range(0, n, chunk):
+        k = min(chunk, n - start)
+        yield {"order_id": np.arange(start + 1, start + k + 1, dtype=np.int64),
+               "product_code": streams[0].choice(len(products), size=k, p=weights).astype(np.int32),
+               # HIGH is code 0, LOW code 1 (the order np.unique gives the names)
+               "priority_code": (streams[1].random(k) >= high).astype(np.int8),
+               "quantity": streams[2].integers(quantity[0], quantity[1] + 1, size=k, dtype=np.int64)}
+
+
+def generate_table(n, seed=0, products=PRODUCTS, **options):
+    """ OrderTable of a generated order book, built in memory (see generate for the options) """
+
+    chunks = list(generate(n, seed, products, **options))
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0, dtype)
+               for name, dtype in COLUMNS}
+    return OrderTable(None, list(products), columns["product_code"], PRIORITIES, columns["priority_code"],
+                      columns["quantity"], columns["order_id"])
+
+
+def write_jsonl(path, chunks, products=PRODUCTS):
+    """ Stream generated chunks to a JSON Lines file """
+
+    with open(path, 'w') as file:
+        for columns in chunks:
+            lines = ['{"id": "%d", "priority": "%s", "product": "%s", "quantity": %d}\n'
+                     % (order_id, PRIORITIES[priority], products[product], quantity)
+                     for order_id, product, priority, quantity in
+                     zip(columns["order_id"].tolist(), columns["product_code"].tolist(),
+                         columns["priority_code"].tolist(), columns["quantity"].tolist())]
+            file.writelines(lines)
+
+
+def write_binary(path, n, chunks, products=PRODUCTS, priorities=PRIORITIES):
+    """ Stream generated chunks of an n order book to the columnar binary format:
+    MAGIC, an 8-byte header length, a JSON header (size, names, column dtypes and
+    offsets), then each column as a contiguous little-endian array
+    The book is written to a temporary file that then replaces path, so a book that is
+    memory-mapped (or being read, e.g. as one of the chunks) is never overwritten """
+
+    header, offset = {"size": n, "products": list(products), "priorities": list(priorities), "columns": {}}, 0
+    for name, dtype in COLUMNS:
+        header["columns"][name] = [dtype, offset]
+        offset = _aligned(offset + n * np.dtype(dtype).itemsize)
+    encoded = json.dumps(header).encode()
+    base = _aligned(len(MAGIC) + _LENGTH.size + len(encoded))
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(MAGIC + _LENGTH.pack(len(encoded)) + encoded)
+            file.truncate(base + offset)
+            start = 0
+            for columns in chunks:
+                k = len(columns["order_id"])
+                for name, dtype in COLUMNS:
+                    file.seek(base + header["columns"][name][1] + start * np.dtype(dtype).itemsize)
+                    file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+                start += k
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def read_binary(path, mmap=True):
+    """ Header and {column name: array} of a binary order book
+    With mmap the columns are read-only memory maps of the file, otherwise in-memory copies """
+
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a binary order book" % path)
+        (length,) = _LENGTH.unpack(file.read(_LENGTH.size))
+        header = json.loads(file.read(length))
+        base = _aligned(len(MAGIC) + _LENGTH.size + length)
+        columns = {}
+        for name, (dtype, offset) in header["columns"].items():
+            if mmap and header["size"]:
+                columns[name] = np.memmap(path, dtype=dtype, mode='r', offset=base + offset,
+                                          shape=(header["size"],))
+            else:
+                file.seek(base + offset)
+                columns[name] = np.fromfile(file, dtype=dtype, count=header["size"])
+    return header, columns
+
+
+def compile_table(table, path):
+    """ Write an OrderTable to the binary format and return it memory-mapped from there
+    The order ids become the keys, so they must be the table's keys as integers.
+    A table already mapped from path is returned as it is """
+
+    if table.path is not None and table.path == os.path.abspath(path):
+        return table
+    if table.keys is not None and any(key != str(order_id) for key, order_id in
+                                      zip(table.keys, table.order_id.tolist())):
+        raise ValueError("order keys must be the order ids to compile the table")
+    columns = {"order_id": table.order_id, "product_code": table.product_code,
+               "priority_code": table.priority_code, "quantity": table.quantity}
+    write_binary(path, len(table), [columns], table.product_names, table.priority_names)
+    return open_table(path)
+
+
+def open_table(path):
+    """ OrderTable memory-mapped read-only from a binary order book
+    The table pickles as its path, so worker processes map the same file instead of copying it.
+    A file is mapped once per process: solutions unpickled from other processes (e.g. island
+    migrants) share this process's table object, so Schedule.stack needs no remapping """
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _mapped:
+        header, columns = read_binary(path)
+        _mapped[key] = OrderTable(None, header["products"], columns["product_code"], header["priorities"],
+                                  columns["priority_code"], columns["quantity"], columns["order_id"], path=path)
+    return _mapped[key]
+
+
+def read_jsonl(path, chunk=100000):
+    """ Columns of a JSON Lines order book: (keys, product names, product codes, priority names,
+    priority codes, quantities). Lines are decoded chunk orders at a time and coded
+    immediately, so only one chunk of orders is ever held as dicts """
+
+    keys, product_code, priority_code, quantity = [], [], [], []
+    products, priorities = {}, {}  # name -> code, in order of first appearance
+    with open(path) as file:
+        while True:
+            lines = [line for line in itertools.islice(file, chunk) if line.strip()]
+            if not lines:
+                break
+            orders = json.loads("[" + ",".join(lines) + "]")
+            keys.extend(order["id"] for order in orders)
+            product_code.append(np.array([products.setdefault(order["product"], len(products))
+                                          for order in orders], dtype=np.int32))
+            priority_code.append(np.array([priorities.setdefault(order["priority"], len(priorities))
+                                           for order in orders], dtype=np.int8))
+            quantity.append(np.array([order["quantity"] for order in orders], dtype=np.int64))
+
+    def joined(arrays, dtype):
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype)
+
+    return (keys, list(products), joined(product_code, np.int32), list(priorities),
+            joined(priority_code, np.int8), joined(quantity, np.int64))
+
+
+def load_table(path):
+    """ OrderTable from orders.json, a .jsonl order book or a binary order book """
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path) as file:
+            return OrderTable.from_orders(json.load(file, object_pairs_hook=OrderedDict))
+
+    if ext == '.jsonl':
+        keys, product_names, product_code, priority_names, priority_code, quantity = read_jsonl(path)
+        order_id = np.array([int(key) for key in keys], dtype=np.int64)
+        # generated ids are 1..n, so the keys need not be kept as strings
+        if np.array_equal(order_id, np.arange(1, len(keys) + 1)):
+            keys = None
+        return OrderTable(keys, product_names, product_code, priority_names, priority_code, quantity, order_id)
+
+    return open_table(path)
+
+
+def main():
+    parser = ArgumentParser(description="Generate a synthetic order book")
+    parser.add_argument('orders', type=int, help='number of orders')
+    parser.add_argument('path', help='output file (.jsonl for JSON Lines, otherwise binary)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--mix', type=float, nargs='+', default=None,
+                        help='relative frequency of each of ' + ', '.join(PRODUCTS))
+    parser.add_argument('--high', type=float, default=0.5, help='fraction of HIGH priority orders')
+    args = parser.parse_args()
+
+    chunks = generate(args.orders, args.seed, mix=args.mix, high=args.high)
+    if args.path.endswith('.jsonl'):
+        write_jsonl(args.path, chunks)
+    else:
+        write_binary(args.path, args.orders, chunks)
+
+
+if __name__ == '__main__':
+    main()
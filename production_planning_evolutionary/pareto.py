@@ -0,0 +1,369 @@
+"""
+@file: pareto.py: NumPy-backed Pareto filtering for the evolutionary framework
+All objectives are minimized. Scores are an (N x objectives) matrix where
+row i holds the objective scores of solution i.
+"""
+
+import bisect
+import random as rand
+import numpy as np
+
+# what ParetoArchive.insert did with a solution
+REJECTED = 0  # dominated (or no room left for another solution with its evaluation): not stored
+ENTERED = 1  # a new evaluation: the front changed in score space
+STORED = 2  # an evaluation already in the front: the solution replaces or joins its solutions
+
+
+def score_matrix(evals):
+    """ Convert evaluations ((obj1, score1), (obj2, score2), ...) into an (N x objectives) score matrix """
+
+    evals = list(evals)
+    if len(evals) == 0:
+        return np.empty((0, 0))
+    return np.array([[score for _, score in eval] for eval in evals], dtype=float)
+
+
+def dominates(p, q):
+    """ True if score vector p dominates score vector q """
+
+    return bool(np.all(p <= q) and np.any(p < q))
+
+
+def non_dominated(scores):
+    """ Boolean mask of the non-dominated rows of an (N x objectives) score matrix
+    (Kung's sort-and-sweep, see kung, for any number of objectives) """
+
+    return kung(scores)
+
+
+def kung(scores):
+    """ Boolean mask of the non-dominated rows using Kung's sort-and-sweep
+    2 and 3 objectives run in O(N log N); more objectives fall back to divide and conquer """
+
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+
+    # sort by the first objective (ties broken on the others), so no row
+    # can be dominated by a row that comes after it
+    order = np.lexsort(scores.T[::-1])
+    if scores.shape[1] == 2:
+        front = _kung_2d(scores, order)
+    elif scores.shape[1] == 3:
+        front = _kung_3d(scores, order)
+    else:
+        front = _kung_front(scores, order)
+
+    mask = np.zeros(n, dtype=bool)
+    mask[front] = True
+    return mask
+
+
+def _kung_2d(scores, order):
+    """ Front of the sorted rows: a row survives if it beats the best second objective seen so far """
+
+    ranked = scores[order]
+    best = np.minimum.accumulate(ranked[:, 1])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = ranked[1:, 1] < best[:-1]
+
+    # exact duplicates of a surviving row do not dominate each other
+    same = np.zeros(len(order), dtype=bool)
+    same[1:] = np.all(ranked[1:] == ranked[:-1], axis=1)
+    for i in np.flatnonzero(same):
+        keep[i] = keep[i - 1]
+    return order[keep]
+
+
+def _kung_3d(scores, order):
+    """ Front of the sorted rows, sweeping a staircase of the last two objectives """
+
+    # staircase of accepted (obj2, obj3) pairs: obj2 increasing, obj3 strictly decreasing
+    xs, ys, firsts = [], [], []
+    front = []
+    for i in order:
+        _, x, y = scores[i]
+
+        # the staircase step at or left of x holds the best obj3 among rows with obj2 <= x
+        pos = bisect.bisect_right(xs, x) - 1
+        if pos >= 0 and ys[pos] <= y:
+            if ys[pos] < y or xs[pos] < x or not np.array_equal(scores[firsts[pos]], scores[i]):
+                continue
+
+        front.append(i)
+
+        # drop the steps this row covers and insert it
+        lo = bisect.bisect_left(xs, x)
+        hi = lo
+        while hi < len(xs) and ys[hi] >= y:
+            hi += 1
+        if lo < len(xs) and xs[lo] == x and ys[lo] == y:
+            continue
+        xs[lo:hi] = [x]
+        ys[lo:hi] = [y]
+        firsts[lo:hi] = [i]
+
+    return np.array(front, dtype=int)
+
+
+def _kung_front(scores, order):
+    """ Front of the sorted rows for any number of objectives, by divide and conquer
+    Exact duplicates are collapsed first and share the fate of their first copy """
+
+    ranked = scores[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(ranked[1:] != ranked[:-1], axis=1)
+    unique = ranked[first]
+    keep = np.zeros(len(unique), dtype=bool)
+    keep[_unique_front(unique, np.arange(len(unique)))] = True
+    return order[keep[np.cumsum(first) - 1]]
+
+
+def _unique_front(unique, idx):
+    """ Indices of the front of the lexicographically sorted, distinct rows idx of unique
+    Between distinct rows, p dominates q exactly when p <= q in every objective """
+
+    if len(idx) <= 64:
+        # small blocks are cheaper to filter directly
+        block = unique[idx]
+        le = np.all(block[:, None, :] <= block[None, :, :], axis=2)
+        np.fill_diagonal(le, False)
+        return idx[~le.any(axis=0)]
+
+    half = len(idx) // 2
+    top = _unique_front(unique, idx[:half])
+    bottom = _unique_front(unique, idx[half:])
+
+    # nothing in the bottom half can dominate the top half, and every top row is
+    # already no worse than every bottom row in the first objective
+    bottom = bottom[~_covered(unique[top], unique[bottom], 1)]
+    return np.concatenate([top, bottom])
+
+
+def _covered(front, candidates, k):
+    """ Boolean mask of the candidate rows that some front row is <= in objectives k onwards,
+    given that every front row is <= every candidate in the objectives before k
+    Splits on the median of objective k, so the cost is O(N log^(objectives - 2) N) """
+
+    n, objectives = len(candidates), front.shape[1]
+    if len(front) == 0 or n == 0:
+        return np.zeros(n, dtype=bool)
+    if k == objectives:
+        return np.ones(n, dtype=bool)
+    if k == objectives - 1:
+        return front[:, k].min() <= candidates[:, k]
+    if k == objectives - 2:
+        # two objectives left: sweep the front by objective k, keeping the best objective k + 1
+        order = np.argsort(front[:, k], kind='stable')
+        best = np.minimum.accumulate(front[order, k + 1])
+        pos = np.searchsorted(front[order, k], candidates[:, k], side='right')
+        return (pos > 0) & (best[np.maximum(pos - 1, 0)] <= candidates[:, k + 1])
+    if len(front) * n <= 1 << 11:
+        le = np.all(front[None, :, k:] <= candidates[:, None, k:], axis=2)
+        return le.any(axis=1)
+
+    values = np.concatenate([front[:, k], candidates[:, k]])
+    top = values.max()
+    if values.min() == top:
+        return _covered(front, candidates, k + 1)
+
+    # rows on the low side of the split beat rows on the high side in objective k, and
+    # rows on the high side can never be <= rows on the low side (the split is the
+    # median, moved below the largest value so that neither side is empty)
+    split = np.partition(values, len(values) // 2)[len(values) // 2]
+    if split == top:
+        split = values[values < top].max()
+    low_front = front[:, k] <= split
+    low = candidates[:, k] <= split
+    covered = np.zeros(n, dtype=bool)
+    covered[low] = _covered(front[low_front], candidates[low], k)
+    covered[~low] = (_covered(front[low_front], candidates[~low], k + 1)
+                     | _covered(front[~low_front], candidates[~low], k))
+    return covered
+
+
+def _ranks_2d(scores):
+    """ Pareto ranks of two objective rows in one sweep of the distinct rows in sorted order:
+    a row's rank is the first front whose lowest second objective so far exceeds its own """
+
+    order = np.lexsort(scores.T[::-1])
+    ranked = scores[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(ranked[1:] != ranked[:-1], axis=1)
+
+    lowest = []  # lowest second objective of each front, increasing
+    unique_ranks = []
+    for y in ranked[first, 1].tolist():
+        rank = bisect.bisect_right(lowest, y)
+        if rank == len(lowest):
+            lowest.append(y)
+        else:
+            lowest[rank] = y
+        unique_ranks.append(rank)
+
+    ranks = np.empty(len(order), dtype=int)
+    ranks[order] = np.array(unique_ranks, dtype=int)[np.cumsum(first) - 1]
+    return ranks
+
+
+def non_dominated_sort(scores):
+    """ Fast non-dominated sort: the Pareto rank of every row (0 = non-dominated front) """
+
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    if n > 0 and scores.shape[1] == 2:
+        return _ranks_2d(scores)
+
+    ranks = np.full(n, -1, dtype=int)
+    remaining = np.arange(n)
+    rank = 0
+
+    # peel off one front at a time
+    while len(remaining) > 0:
+        front = kung(scores[remaining])
+        ranks[remaining[front]] = rank
+        remaining = remaining[~front]
+        rank += 1
+
+    return ranks
+
+
+class ParetoArchive:
+    """ Incrementally maintained non-dominated population: eval -> solution
+    A dominated evaluation is rejected on insert, and an accepted one evicts only
+    the members it dominates, so the archive never needs a full re-filter.
+    duplicates defines how many distinct solutions are kept per evaluation """
+
+    def __init__(self, items=(), duplicates=1):
+        self._scores = None  # (capacity x objectives) score buffer, the first len(self) rows are in use
+        self._evals = []  # evaluations, row aligned with the score buffer
+        self._sols = []  # solutions, row aligned with the score buffer
+        self._rows = {}  # eval -> row
+        self._alts = {}  # eval -> further solutions with the same evaluation
+        self.duplicates = duplicates
+        self.listeners = []  # called with ("add" | "remove", score vector) as evaluations enter and leave
+
+        for eval, sol in items:
+            self.insert(eval, sol)
+
+    def __len__(self):
+        return len(self._evals)
+
+    def __contains__(self, eval):
+        return eval in self._rows
+
+    def __iter__(self):
+        return iter(list(self._evals))
+
+    def __getitem__(self, eval):
+        return self._sols[self._rows[eval]]
+
+    def __setitem__(self, eval, sol):
+        self.insert(eval, sol)
+
+    def keys(self):
+        return list(self._evals)
+
+    def values(self):
+        return list(self._sols)
+
+    def items(self):
+        return list(zip(self._evals, self._sols))
+
+    def all_items(self):
+        """ Every (eval, solution) pair, including the extra solutions kept per evaluation """
+
+        return [(eval, sol) for eval, first in zip(self._evals, self._sols)
+                for sol in [first] + self._alts.get(eval, [])]
+
+    def add_listener(self, listener):
+        """ Register listener(event, scores), told of every evaluation that enters
+        ("add") or leaves ("remove") the archive """
+
+        self.listeners.append(listener)
+
+    def scores(self):
+        """ The (N x objectives) score matrix of the archive (a read-only view) """
+
+        if self._scores is None:
+            return np.empty((0, 0))
+        view = self._scores[:len(self)]
+        view.flags.writeable = False
+        return view
+
+    def choice(self):
+        """ A random solution from the archive (a random evaluation, then one of its solutions) """
+
+        row = rand.randrange(len(self._sols))
+        if self._alts:
+            alts = self._alts.get(self._evals[row])
+            if alts:
+                pick = rand.randrange(len(alts) + 1)
+                return alts[pick - 1] if pick else self._sols[row]
+        return self._sols[row]
+
+    def insert(self, eval, sol):
+        """ Add a solution unless it is dominated. Returns REJECTED, ENTERED or STORED
+        (STORED and ENTERED are truthy, so the result still reads as "was it kept") """
+
+        # same evaluation: the newer solution replaces the old one, or is
+        # kept alongside it while there is room for duplicates
+        row = self._rows.get(eval)
+        if row is not None:
+            if self.duplicates == 1:
+                self._sols[row] = sol
+                return STORED
+            alts = self._alts.setdefault(eval, [])
+            if len(alts) + 1 < self.duplicates:
+                alts.append(sol)
+                return STORED
+            return REJECTED
+
+        p = np.array([score for _, score in eval], dtype=float)
+        n = len(self)
+        if self._scores is None:
+            self._scores = np.empty((16, len(p)))
+        else:
+            front = self._scores[:n]
+
+            # reject if any member dominates the newcomer
+            if np.any(np.all(front <= p, axis=1) & np.any(front < p, axis=1)):
+                return REJECTED
+
+            # evict the members the newcomer dominates (highest rows first so
+            # swap-removal never moves a row that is still to be evicted)
+            evicted = np.flatnonzero(np.all(p <= front, axis=1) & np.any(p < front, axis=1))
+            for row in evicted[::-1]:
+                self._remove(row)
+            n = len(self)
+
+        # grow the score buffer geometrically
+        if n == len(self._scores):
+            grown = np.empty((2 * n, self._scores.shape[1]))
+            grown[:n] = self._scores[:n]
+            self._scores = grown
+
+        self._scores[n] = p
+        self._rows[eval] = n
+        self._evals.append(eval)
+        self._sols.append(sol)
+        for listener in self.listeners:
+            listener("add", p)
+        return ENTERED
+
+    def _remove(self, row):
+        """ Remove a row by moving the last row into its place """
+
+        last = len(self) - 1
+        for listener in self.listeners:
+            listener("remove", self._scores[row].copy())
+        del self._rows[self._evals[row]]
+        self._alts.pop(self._evals[row], None)
+        if row != last:
+            self._scores[row] = self._scores[last]
+            self._evals[row] = self._evals[last]
+            self._sols[row] = self._sols[last]
+            self._rows[self._evals[row]] = row
+        self._evals.pop()
+        self._sols.pop()
@@ -1,7 +1,15 @@
 from evo import Evo
 import json
+from argparse import ArgumentParser
 from collections import OrderedDict
 import pprint as pp
+import numpy as np
+from schedule import Schedule, as_schedule, copy_schedule
+import moves
+from checkpoint import CheckpointStore
+from reporter import Reporter
+from stopping import TimeBudget, Stagnation
+from orderbook import load_table, compile_table
 
 def read_json(filename):
     """ Read in JSON files """
@@ -16,8 +24,8 @@ def read_json(filename):
 
     return orders
 
-def setups(orders):
-    """ Fitness criteria: count the number of setups in the orders list """
+def setups_orders(orders):
+    """ Fitness criteria: count the number of setups in the orders list (OrderedDict form) """
 
     num_setups = 0
 
@@ -35,49 +43,8 @@ def setups(orders):
 
     return num_setups
 
-def setups_agent(solutions):
-    """ Agent: minimize number of setups in orders list """
-
-    # set orders to current solution and ids to current ids
-    orders = solutions[0]
-    order_ids = list(orders.keys())
-
-    # keep track of index where next product doesn't match current product
-    index = 0
-
-    # iterate through orders
-    for i in range(len(order_ids)):
-        key = order_ids[i]
-        value = orders[str(key)]["product"]
-        if i < len(order_ids) - 1:
-            next = order_ids[i + 1]
-
-            # stop iterating and set index to current i when current product doesn't match the next product
-            if (int(next) != len(order_ids) + 1) and (value != orders[next]["product"]):
-                index = i
-                break
-    
-    # initialize next product
-    next = order_ids[index + 1]
-
-    # iterate through orders starting at current index and move next order until next product matches
-    for i in range(index, len(order_ids)):
-
-        # move to end in dict and list of ids
-        orders.move_to_end(next)
-        order_ids.append(order_ids.pop(order_ids.index(next)))
-
-        # update next index to move
-        next = order_ids[index + 1]
-
-        # check if current order matches next one
-        if (int(next) != len(order_ids) + 1) and (value == orders[next]["product"]):
-            break
-
-    return orders
-
-def low_priority(orders):
-    """ Fitness criteria: quantify amount of low priority orders done before last high priority """
+def low_priority_orders(orders):
+    """ Fitness criteria: quantify amount of low priority orders done before last high priority (OrderedDict form) """
 
     # initialize score and set order ids
     score = 0
@@ -98,26 +65,8 @@ def low_priority(orders):
 
     return score
 
-def low_priority_agent(solutions):
-    """ Agent: minimize lowpriority score """
-
-    # set orders to current solution and ids to current ids
-    orders = solutions[0]
-    order_ids = list(orders.keys())
-
-    # iterate through orders
-    for i in range(len(order_ids)):
-        key = order_ids[i]
-        
-        # if order is low priority move it to end
-        if orders[key]["priority"] == "LOW":
-            orders.move_to_end(key)
-            break
-
-    return orders
-
-def delays(orders):
-    """ Fitness criteria: quantify amount of delay in orders list """
+def delays_orders(orders):
+    """ Fitness criteria: quantify amount of delay in orders list (OrderedDict form) """
 
     # initialize delay and set order ids
     delay = 0
@@ -134,44 +83,168 @@ def delays(orders):
 
     return delay
 
-def delays_agent(solutions):
-    """ Agent: minimize delay """
+def _setups(table, perm):
+    """ Kernel: setups of a permutation (or of each row of a stack of permutations) """
 
-    # set orders to current solution and ids to current ids
-    orders = solutions[0]
-    order_ids = list(orders.keys())
+    # every change of product between neighbouring orders is a setup
+    return np.count_nonzero(np.diff(table.product_code[perm], axis=-1), axis=-1)
 
-    # iterate through order ids
-    for i in range(len(order_ids) - 1):
-        key = order_ids[i]
-        next = order_ids[i + 1]
+def _low_priority(table, perm):
+    """ Kernel: (low priority score, position of the last high priority order or -1), per permutation """
 
-        # if current order id is greater than next order's order id, swap them
-        if int(key) > int(next):
+    high = table.is_high[perm]
+    n = high.shape[-1]
 
-            # swap orders in dictionary
-            orders_list = list(orders.items())
-            orders_list[i], orders_list[i + 1] = orders_list[i + 1], orders_list[i]
-            orders = OrderedDict(orders_list)
+    # quantity of low priority orders scheduled before the last high priority order
+    last_high = np.where(high.any(axis=-1), n - 1 - np.argmax(high[..., ::-1], axis=-1), -1)
+    before = np.arange(n) < last_high[..., None]
+    return np.sum(table.quantity[perm] * (before & table.is_low[perm]), axis=-1), last_high
 
-            # swap orders in order ids list
-            order_ids[i], order_ids[i + 1] = order_ids[i + 1], order_ids[i]
+def _delays(table, perm):
+    """ Kernel: delays of a permutation (or of each row of a stack of permutations) """
 
-            break
+    # an order scheduled before an order with a smaller id is delayed by its quantity
+    late = np.diff(table.order_id[perm], axis=-1) < 0
+    return np.sum(table.quantity[perm[..., :-1]] * late, axis=-1)
 
-    return orders
+def setups(sol):
+    """ Fitness criteria: count the number of setups in the schedule """
 
-def main():
-    # read in data
-    orders = read_json('orders.json')
+    sol = as_schedule(sol)
+    if "setups" not in sol.scores:
+        sol.scores["setups"] = int(_setups(sol.table, sol.perm))
+    return sol.scores["setups"]
+
+def low_priority(sol):
+    """ Fitness criteria: quantify amount of low priority orders done before last high priority """
+
+    sol = as_schedule(sol)
+    if "low_priority" not in sol.scores:
+        score, last_high = _low_priority(sol.table, sol.perm)
+        sol.scores["low_priority"] = int(score)
+        sol.scores["last_high"] = int(last_high)
+    return sol.scores["low_priority"]
+
+def delays(sol):
+    """ Fitness criteria: quantify amount of delay in the schedule """
+
+    sol = as_schedule(sol)
+    if "delays" not in sol.scores:
+        sol.scores["delays"] = int(_delays(sol.table, sol.perm))
+    return sol.scores["delays"]
 
-    # Create enivronment
-    E = Evo()
+def _cached_batch(batch, name, kernel):
+    """ Scores of every row of a batch schedule, running the kernel only on rows without a cached score """
 
-    # Register fitness criteria
-    E.add_fitness_criteria("setups", setups)
-    E.add_fitness_criteria("low_priority", low_priority)
-    E.add_fitness_criteria("delays", delays)
+    missing = [i for i, cache in enumerate(batch.scores) if name not in cache]
+    if missing:
+        if name == "low_priority":
+            scores, last_highs = _low_priority(batch.table, batch.perm[missing])
+            for i, last_high in zip(missing, last_highs.tolist()):
+                batch.scores[i]["last_high"] = last_high
+        else:
+            scores = kernel(batch.table, batch.perm[missing])
+        for i, score in zip(missing, scores.tolist()):
+            batch.scores[i][name] = score
+    return np.array([cache[name] for cache in batch.scores])
+
+def setups_batch(batch):
+    """ Batch fitness criteria: number of setups of each row of a (K x orders) batch schedule """
+
+    return _cached_batch(batch, "setups", _setups)
+
+def low_priority_batch(batch):
+    """ Batch fitness criteria: low priority quantity before the last high priority order, per row """
+
+    return _cached_batch(batch, "low_priority", _low_priority)
+
+def delays_batch(batch):
+    """ Batch fitness criteria: quantity of orders scheduled before an order with a smaller id, per row """
+
+    return _cached_batch(batch, "delays", _delays)
+
+def setups_agent(solutions):
+    """ Agent: minimize number of setups in the schedule """
+
+    sol = as_schedule(solutions[0])
+    perm = sol.perm
+    codes = sol.table.product_code[perm]
+
+    # find first index where next product doesn't match current product
+    changes = np.flatnonzero(np.diff(codes))
+    if len(changes) > 0:
+        index = changes[0]
+        value = codes[index]
+    else:
+        index = 0
+        value = codes[-1]
+
+    # move the orders after index to the end, up to the next order with a matching product
+    matches = np.flatnonzero(codes[index + 2:] == value)
+    if len(matches) > 0:
+        moves.block_move(sol, index + 1, index + 2 + matches[0], len(perm))
+    elif codes[index + 1] != value:
+        moves.insert(sol, index + 1, len(perm) - 1)
+
+    return sol
+
+def low_priority_agent(solutions):
+    """ Agent: minimize lowpriority score """
+
+    sol = as_schedule(solutions[0])
+
+    # move the first low priority order to the end
+    lows = np.flatnonzero(sol.table.is_low[sol.perm])
+    if len(lows) > 0:
+        moves.insert(sol, lows[0], len(sol.perm) - 1)
+
+    return sol
+
+def delays_agent(solutions):
+    """ Agent: minimize delay """
+
+    sol = as_schedule(solutions[0])
+
+    # swap the first pair of orders whose ids are out of order
+    late = np.flatnonzero(np.diff(sol.table.order_id[sol.perm]) < 0)
+    if len(late) > 0:
+        moves.swap(sol, late[0], late[0] + 1)
+
+    return sol
+
+def seed_schedules(table):
+    """ Heuristic starting schedules, each a lexicographic sort of the order table:
+    by id (no delays), HIGH priority first (no low priority score), grouped by product
+    (fewest setups), and blends of these, with the product groups in every rotation """
+
+    ids = table.order_id
+    low = table.is_low
+    keys = [(ids,), (ids, low)]
+    for shift in range(len(table.product_names)):
+        # np.lexsort sorts by the last key first
+        product = (table.product_code + shift) % len(table.product_names)
+        keys += [(ids, product), (ids, product, low), (ids, low, product)]
+    return [Schedule(table, np.lexsort(key).astype(np.int32)) for key in keys]
+
+def main():
+    # read in data (orders.json, or a generated order book, see orderbook.py)
+    parser = ArgumentParser(description="Evolve production schedules")
+    parser.add_argument('orders', nargs='?', default='orders.json', help='orders file (.json, .jsonl or binary)')
+    parser.add_argument('--table', default=None,
+                        help='compile the orders to this binary file and memory-map them from it')
+    args = parser.parse_args()
+    table = load_table(args.orders)
+    if args.table is not None:
+        table = compile_table(table, args.table)
+
+    # Create enivronment (agents only need a copy of the permutation, and
+    # re-discovered permutations are recognized by fingerprint instead of re-scored)
+    E = Evo(copier=copy_schedule, stacker=Schedule.stack, fingerprint=Schedule.fingerprint)
+
+    # Register fitness criteria (scored a batch of offspring at a time)
+    E.add_fitness_criteria("setups", setups_batch, batch=True)
+    E.add_fitness_criteria("low_priority", low_priority_batch, batch=True)
+    E.add_fitness_criteria("delays", delays_batch, batch=True)
 
     # Register agents
     E.add_agent("setups_agent", setups_agent)
@@ -179,13 +252,28 @@ def main():
     E.add_agent("delays_agent", delays_agent)
 
     # Add initial solution
-    E.add_solution(orders)
-
-    # Run the evolver
-    E.evolve(10000, 500, 10000)
-
-    # save solutions to csv file
-    E.save_solutions()
+    initial = Schedule(table)
+    E.add_solution(initial)
+
+    # Seed the front with heuristic schedules
+    E.add_solutions(seed_schedules(table))
+
+    # Resume from the previous run's checkpoint for the same order book, if any
+    book = "%d orders, digest %s" % (len(table), table.digest())
+    store = CheckpointStore('checkpoint-' + table.digest()[:16], encode=Schedule.encode,
+                            decode=initial.table.decode, identity=book)
+    store.restore(E)
+
+    # Run the evolver and report where the time went: the best front within
+    # 30 seconds, or earlier once the front stops changing
+    profiler = E.enable_profiling()
+    E.evolve(10000, status=10000, batch=50, checkpoint=store, reporter=Reporter(every=1000),
+             stop=TimeBudget(30) | Stagnation(5000))
+    store.close()
+    print(profiler.summary())
+
+    # save solutions (scores and order permutation) to csv file
+    E.save_solutions("solutions.csv", encode=lambda sol: sol.perm, teamname="NukalaSRiveraA")
 
     # visualize tradeoffs
     E.visualize()
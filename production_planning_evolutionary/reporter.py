@@ -0,0 +1,135 @@
+"""
+@file: reporter.py: Background progress reporting for the Evo framework
+evolve hands the reporter a copy of the front's score matrix (never the
+solutions). Plots and CSV exports are rendered on a worker thread, so the
+evolution loop never waits for matplotlib.
+"""
+
+import csv
+import os
+import threading
+
+from matplotlib.figure import Figure
+
+
+class Reporter:
+    """ Renders snapshots of the front on a background thread
+    Only the latest snapshot is kept: if rendering falls behind, older snapshots are skipped
+    An exception while rendering stops the worker and is raised by the next submit or close """
+
+    def __init__(self, every=1000, directory='reports', plot=True, export=True):
+        """ every defines how often (in iterations) evolve submits a snapshot
+        plot renders front.png (pairwise scatter) and progress.png (front size and best scores)
+        export writes the front's scores to front.csv """
+
+        self.every = every
+        self.directory = directory
+        self.plot = plot
+        self.export = export
+        self.history = []  # (iteration, front size, best score per objective)
+
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._error = None  # exception the worker thread stopped on
+
+    def due(self, i, batch=1):
+        """ Should a snapshot be submitted in the batch starting at iteration i? """
+
+        return i % self.every < batch
+
+    def submit(self, iteration, names, scores):
+        """ Queue a snapshot (iteration, objective names, score matrix) without blocking """
+
+        if self._error is not None:
+            self.close()
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        with self._lock:
+            self._pending = (iteration, list(names), scores)
+        self._wake.set()
+
+    def close(self):
+        """ Render the last snapshot and stop the worker thread
+        Raises the exception that stopped the worker, if rendering failed """
+
+        if self._thread is None:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._closed = False
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+            if snapshot is not None:
+                try:
+                    self._render(*snapshot)
+                except Exception as error:
+                    self._error = error
+                    return
+            if self._closed and self._pending is None:
+                return
+
+    def _render(self, iteration, names, scores):
+        """ Write the exports and plots for one snapshot (runs on the worker thread) """
+
+        best = scores.min(axis=0).tolist() if len(scores) else [None] * len(names)
+        self.history.append((iteration, len(scores), best))
+
+        if self.export:
+            with open(os.path.join(self.directory, 'front.csv'), 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(names)
+                writer.writerows(scores.tolist())
+
+        if self.plot:
+            self._plot_front(iteration, names, scores)
+            self._plot_progress(names)
+
+    def _plot_front(self, iteration, names, scores):
+        """ Pairwise scatter plots of the objectives """
+
+        d = len(names)
+        scores = scores.reshape(-1, d)  # an empty archive's score matrix is (0, 0)
+        fig = Figure(figsize=(3 * d, 3 * d))
+        for row in range(d):
+            for col in range(d):
+                ax = fig.add_subplot(d, d, row * d + col + 1)
+                if row == col:
+                    ax.hist(scores[:, col], bins=20)
+                else:
+                    ax.scatter(scores[:, col], scores[:, row], s=6)
+                if row == d - 1:
+                    ax.set_xlabel(names[col])
+                if col == 0:
+                    ax.set_ylabel(names[row])
+        fig.suptitle("Front at iteration %d (%d solutions)" % (iteration, len(scores)))
+        fig.savefig(os.path.join(self.directory, 'front.png'))
+
+    def _plot_progress(self, names):
+        """ Front size and best score per objective over the run """
+
+        iterations = [i for i, _, _ in self.history]
+        fig = Figure(figsize=(4 * (len(names) + 1), 3))
+        ax = fig.add_subplot(1, len(names) + 1, 1)
+        ax.plot(iterations, [size for _, size, _ in self.history])
+        ax.set_title("front size")
+        for k, name in enumerate(names):
+            ax = fig.add_subplot(1, len(names) + 1, k + 2)
+            ax.plot(iterations, [best[k] for _, _, best in self.history])
+            ax.set_title("best " + name)
+        fig.tight_layout()
+        fig.savefig(os.path.join(self.directory, 'progress.png'))
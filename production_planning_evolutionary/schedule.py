@@ -0,0 +1,217 @@
+"""
+@file: schedule.py: Compact permutation-based solutions for production planning
+A solution is a permutation of row indices into an order table that is
+shared (never copied) by every solution in the population.
+"""
+
+from collections import OrderedDict
+from collections.abc import Mapping
+import hashlib
+import weakref
+import numpy as np
+
+_tables = weakref.WeakValueDictionary() # digest -> the table with those contents in this process
+
+
+class OrderTable:
+    """ Immutable table of the static order attributes, one row per order.
+    Products and priorities are integer-coded so objectives reduce to array operations.
+    keys may be None for large tables: the keys are then the order ids as strings,
+    built only when asked for. A table memory-mapped from a binary order book
+    (see orderbook.open_table) knows its path and pickles as that path; any other table
+    pickles with its digest, and unpickles as the process's table with that digest if it
+    already has one, so solutions coming back from worker processes share one table """
+
+    __slots__ = ('keys', 'product_names', 'product_code', 'priority_names', 'priority_code',
+                 'quantity', 'order_id', 'is_high', 'is_low', 'path', '_rows', '_digest', '__weakref__')
+
+    def __init__(self, keys, product_names, product_code, priority_names, priority_code, quantity, order_id,
+                 path=None):
+        """ Build the table from its columns (see from_orders)
+        path is the binary order book the columns are mapped from, if any """
+
+        set_attr = super().__setattr__
+        set_attr('keys', None if keys is None else tuple(keys))
+        set_attr('product_names', tuple(product_names))
+        set_attr('product_code', np.asarray(product_code, dtype=np.int32))
+        set_attr('priority_names', tuple(priority_names))
+        set_attr('priority_code', np.asarray(priority_code, dtype=np.int8))
+        set_attr('quantity', np.asarray(quantity, dtype=np.int64))
+        set_attr('order_id', np.asarray(order_id, dtype=np.int64))
+        set_attr('path', path)
+        set_attr('_rows', None)  # key -> row, built on first lookup
+        set_attr('_digest', None)  # see digest
+
+        # priority masks used by the low priority objective and agent
+        set_attr('is_high', self._priority_mask("HIGH"))
+        set_attr('is_low', self._priority_mask("LOW"))
+
+        for column in (self.product_code, self.priority_code, self.quantity, self.order_id,
+                       self.is_high, self.is_low):
+            column.flags.writeable = False
+
+    @classmethod
+    def from_orders(cls, orders):
+        """ Build the table from the orders OrderedDict: order id -> {priority, product, quantity} """
+
+        product_names, product_code = np.unique([order["product"] for order in orders.values()],
+                                                return_inverse=True)
+        priority_names, priority_code = np.unique([order["priority"] for order in orders.values()],
+                                                  return_inverse=True)
+        return cls(orders.keys(), product_names.tolist(), product_code, priority_names.tolist(), priority_code,
+                   [order["quantity"] for order in orders.values()],
+                   [int(key) for key in orders.keys()])
+
+    def _priority_mask(self, name):
+        """ Boolean column: does the order have this priority? """
+
+        if name not in self.priority_names:
+            return np.zeros(len(self), dtype=bool)
+        return self.priority_code == self.priority_names.index(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("OrderTable is immutable")
+
+    def __len__(self):
+        return len(self.order_id)
+
+    def __reduce__(self):
+        if self.path is not None:
+            from orderbook import open_table
+            return open_table, (self.path,)
+        digest = self.digest()
+        _tables.setdefault(digest, self)
+        return _unpickle_table, (digest, self.keys, self.product_names, self.product_code, self.priority_names,
+                                 self.priority_code, self.quantity, self.order_id)
+
+    def digest(self):
+        """ Hash of the table's contents: equal tables (e.g. copies in other processes) have equal digests """
+
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(repr((self.keys, self.product_names, self.priority_names)).encode())
+            for column in (self.product_code, self.priority_code, self.quantity, self.order_id):
+                h.update(np.ascontiguousarray(column).tobytes())
+            super().__setattr__('_digest', h.hexdigest())
+        return self._digest
+
+    def key(self, row):
+        """ Order id of a row """
+
+        return self.keys[row] if self.keys is not None else str(self.order_id[row])
+
+    def row(self, key):
+        """ Row index of an order id """
+
+        if self._rows is None:
+            keys = self.keys if self.keys is not None else map(str, self.order_id.tolist())
+            super().__setattr__('_rows', {key: row for row, key in enumerate(keys)})
+        return self._rows[key]
+
+    def decode(self, data):
+        """ Schedule over this table from the bytes written by Schedule.encode """
+
+        return Schedule(self, np.frombuffer(data, dtype=np.int32).copy())
+
+    def to_orders(self, perm):
+        """ Orders OrderedDict for the rows in perm """
+
+        orders = OrderedDict()
+        for row in perm:
+            orders[self.key(row)] = {"priority": self.priority_names[self.priority_code[row]],
+                                      "product": self.product_names[self.product_code[row]],
+                                      "quantity": int(self.quantity[row])}
+        return orders
+
+
+class Schedule:
+    """ A production schedule: a permutation of the rows of a shared order table.
+    scores caches objective values (objective name -> score); the moves in moves.py keep
+    it up to date by delta evaluation, so code that edits perm directly must clear it """
+
+    __slots__ = ('table', 'perm', 'scores')
+
+    def __init__(self, table, perm=None, scores=None):
+        self.table = table
+        if perm is None:
+            perm = np.arange(len(table), dtype=np.int32)
+        self.perm = perm
+        self.scores = {} if scores is None else scores
+
+    @classmethod
+    def from_orders(cls, orders, table=None):
+        """ Adapter from the orders OrderedDict form. The order of the dict is the schedule """
+
+        if table is None:
+            table = OrderTable.from_orders(orders)
+        perm = np.fromiter((table.row(key) for key in orders.keys()), dtype=np.int32, count=len(orders))
+        return cls(table, perm)
+
+    def to_orders(self):
+        """ Adapter back to the orders OrderedDict form """
+
+        return self.table.to_orders(self.perm)
+
+    def encode(self):
+        """ Compact stored form: the raw int32 permutation (see OrderTable.decode) """
+
+        return self.perm.astype(np.int32, copy=False).tobytes()
+
+    def fingerprint(self):
+        """ Hash of the permutation, identifying the schedule regardless of how it was reached """
+
+        return hash(self.perm.tobytes())
+
+    def copy(self):
+        """ A copy that shares the order table and owns its permutation """
+
+        return Schedule(self.table, self.perm.copy(), dict(self.scores))
+
+    @staticmethod
+    def stack(sols):
+        """ Stack solutions into one (K x orders) batch schedule over the first solution's order table
+        The batch's scores is the list of the solutions' score caches """
+
+        table = sols[0].table
+        perms = [sol.perm if sol.table is table or sol.table.digest() == table.digest()
+                 else Schedule.from_orders(sol.to_orders(), table).perm for sol in sols]
+        return Schedule(table, np.stack(perms), [sol.scores for sol in sols])
+
+    def order_ids(self):
+        """ Order ids in scheduled order """
+
+        key = self.table.key
+        return [key(row) for row in self.perm]
+
+    def __len__(self):
+        return len(self.perm)
+
+    def __str__(self):
+        return str(self.order_ids())
+
+
+def _unpickle_table(digest, *columns):
+    """ The table with this digest in this process, built from columns if there is none yet """
+
+    table = _tables.get(digest)
+    if table is None:
+        table = OrderTable(*columns)
+        object.__setattr__(table, '_digest', digest)
+        _tables[digest] = table
+    return table
+
+
+def as_schedule(sol):
+    """ Accept either a Schedule or an orders OrderedDict """
+
+    if isinstance(sol, Mapping):
+        return Schedule.from_orders(sol)
+    return sol
+
+
+def copy_schedule(sol):
+    """ Private copy of a solution for an agent (orders OrderedDicts are adapted, which copies them) """
+
+    if isinstance(sol, Mapping):
+        return Schedule.from_orders(sol)
+    return sol.copy()
@@ -0,0 +1,88 @@
+"""
+@file: scheduler.py: Agent schedulers for the Evo framework
+A scheduler decides which agents evolve runs. pick(names, k) returns k agent
+names and update(name, reward) is told whether the agent's offspring made it
+into the front (reward 1) or not (reward 0).
+"""
+
+import math
+import random as rand
+
+
+class UniformScheduler:
+    """ Every agent is equally likely (the classic Evo behaviour) """
+
+    def pick(self, names, k=1):
+        return rand.choices(names, k=k)
+
+    def update(self, name, reward):
+        pass
+
+
+class WeightedScheduler:
+    """ Agents are picked with fixed relative weights (unlisted agents get weight 1) """
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+
+    def pick(self, names, k=1):
+        return rand.choices(names, weights=[self.weights.get(name, 1.0) for name in names], k=k)
+
+    def update(self, name, reward):
+        pass
+
+
+class UCBScheduler:
+    """ Upper confidence bound (UCB1) on each agent's discounted acceptance rate
+    discount < 1 forgets old rewards so the scheduler tracks recent behaviour """
+
+    def __init__(self, c=0.5, discount=0.999):
+        self.c = c
+        self.discount = discount
+        self.counts = {}  # name -> discounted number of runs
+        self.rewards = {}  # name -> discounted sum of rewards
+
+    def pick(self, names, k=1):
+        # try every agent once before trusting the estimates
+        untried = [name for name in names if self.counts.get(name, 0.0) == 0.0]
+        if untried:
+            return [untried[i % len(untried)] for i in range(k)]
+
+        total = sum(self.counts[name] for name in names)
+        log_total = math.log(total) if total > 1.0 else 0.0
+
+        def bound(name):
+            n = self.counts[name]
+            return self.rewards[name] / n + self.c * math.sqrt(log_total / n)
+
+        return [max(names, key=bound)] * k
+
+    def update(self, name, reward):
+        # decaying every agent keeps the update O(number of agents)
+        if self.discount < 1.0:
+            for other in self.counts:
+                self.counts[other] *= self.discount
+                self.rewards[other] *= self.discount
+        self.counts[name] = self.counts.get(name, 0.0) + 1.0
+        self.rewards[name] = self.rewards.get(name, 0.0) + reward
+
+
+class SoftmaxScheduler:
+    """ Boltzmann selection on an exponential moving average of each agent's reward
+    temperature controls exploration, alpha how fast the averages follow recent rewards """
+
+    def __init__(self, temperature=0.1, alpha=0.05, initial=1.0):
+        self.temperature = temperature
+        self.alpha = alpha
+        self.initial = initial  # optimistic start so every agent gets tried
+        self.values = {}  # name -> average recent reward
+
+    def pick(self, names, k=1):
+        values = [self.values.get(name, self.initial) for name in names]
+        top = max(values)
+        weights = [math.exp((value - top) / self.temperature) for value in values]
+        return rand.choices(names, weights=weights, k=k)
+
+    def update(self, name, reward):
+        value = self.values.get(name, self.initial)
+        self.values[name] = value + self.alpha * (reward - value)
@@ -0,0 +1,117 @@
+"""
+@file: stopping.py: Stopping criteria for Evo.evolve
+A criterion is started once when evolve begins (start(evo)) and is then asked
+after every batch whether the run is done (done(evo, iteration)). Checks are
+a clock read or a counter comparison, so they cost nothing next to an agent.
+Criteria combine with | (stop when either is met) and & (stop when both are met):
+
+    E.evolve(None, stop=TimeBudget(30) | Stagnation(5000))
+"""
+
+import time
+
+
+class Criterion:
+    """ Base class: never stops on its own """
+
+    def start(self, evo):
+        pass
+
+    def done(self, evo, iteration):
+        return False
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+
+class AnyOf(Criterion):
+    """ Stop as soon as one of the criteria is met """
+
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def start(self, evo):
+        for criterion in self.criteria:
+            criterion.start(evo)
+
+    def done(self, evo, iteration):
+        # every criterion is asked so stateful ones (stagnation) keep up to date
+        results = [criterion.done(evo, iteration) for criterion in self.criteria]
+        return any(results)
+
+
+class AllOf(AnyOf):
+    """ Stop once all of the criteria are met """
+
+    def done(self, evo, iteration):
+        results = [criterion.done(evo, iteration) for criterion in self.criteria]
+        return all(results)
+
+
+class TimeBudget(Criterion):
+    """ Stop once seconds of wall-clock time have passed since evolve started """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = None
+
+    def start(self, evo):
+        self.deadline = time.perf_counter() + self.seconds
+
+    def done(self, evo, iteration):
+        return time.perf_counter() >= self.deadline
+
+
+class EvaluationBudget(Criterion):
+    """ Stop once evaluations solutions have been scored since evolve started
+    (solutions found in the fingerprint cache are not scored and do not count) """
+
+    def __init__(self, evaluations):
+        self.evaluations = evaluations
+        self.limit = None
+
+    def start(self, evo):
+        self.limit = evo.evaluations + self.evaluations
+
+    def done(self, evo, iteration):
+        return evo.evaluations >= self.limit
+
+
+class Stagnation(Criterion):
+    """ Stop when the front has not improved for k iterations
+    Without a hypervolume tracker any front change counts as an improvement.
+    With one (see Evo.track_hypervolume), only a hypervolume gain above tol does """
+
+    def __init__(self, k, hypervolume=None, tol=0.0):
+        self.k = k
+        self.hypervolume = hypervolume
+        self.tol = tol
+        self.changed = False
+        self.best = None
+        self.last = 0  # iteration of the last improvement
+
+    def __call__(self, event, scores):
+        """ ParetoArchive listener: note that the front changed """
+
+        self.changed = True
+
+    def start(self, evo):
+        self.last = 0
+        self.changed = False
+        if self.hypervolume is not None:
+            self.best = self.hypervolume.value
+        elif self not in evo.pop.listeners:
+            evo.pop.add_listener(self)
+
+    def done(self, evo, iteration):
+        if self.hypervolume is not None:
+            if self.hypervolume.value > self.best + self.tol:
+                self.best = self.hypervolume.value
+                self.last = iteration
+        elif self.changed:
+            self.changed = False
+            self.last = iteration
+        return iteration - self.last >= self.k